@@ -0,0 +1,95 @@
+from django.conf import settings
+from collections import deque
+import threading
+import time
+
+DEFAULT_ADMISSION = {
+    'ENABLED': True,
+    'MAX_RUNS': 8,
+    'MAX_NODES': 200000,
+    'MAX_QUEUED': 64,
+    'QUEUE_TIMEOUT': 30,
+    'RETRY_AFTER': 1,
+}
+
+
+def admission_options():
+    return {**DEFAULT_ADMISSION, **getattr(settings, 'RUN_ADMISSION', {})}
+
+
+class RunRejected(Exception):
+    pass
+
+
+class AdmissionController:
+    """Caps the runs executing at once and the enabled nodes they hold between them.
+
+    Runs over either cap wait first come, first served in a bounded queue.
+    A run is rejected when the queue is full or its wait times out.
+    """
+
+    def __init__(self, max_runs, max_nodes, max_queued, timeout):
+        self.max_runs = max_runs
+        self.max_nodes = max_nodes
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self.condition = threading.Condition()
+        self.running = 0
+        self.nodes = 0
+        self.queue = deque()
+
+    def fits(self, nodes):
+        return self.running < self.max_runs and self.nodes + nodes <= self.max_nodes
+
+    def acquire(self, nodes):
+        """Block until the run may execute; returns the node count to release afterwards."""
+        # A run larger than the node cap is admitted alone rather than never.
+        nodes = min(nodes, self.max_nodes)
+        with self.condition:
+            if not self.queue and self.fits(nodes):
+                self.running += 1
+                self.nodes += nodes
+                return nodes
+            if len(self.queue) >= self.max_queued:
+                raise RunRejected("Too many runs waiting to execute, retry later.")
+
+            ticket = object()
+            self.queue.append(ticket)
+            deadline = time.monotonic() + self.timeout
+            try:
+                while self.queue[0] is not ticket or not self.fits(nodes):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise RunRejected("Timed out waiting for an execution slot, retry later.")
+                    self.condition.wait(remaining)
+            finally:
+                self.queue.remove(ticket)
+                self.condition.notify_all()
+            self.running += 1
+            self.nodes += nodes
+            return nodes
+
+    def release(self, nodes):
+        with self.condition:
+            self.running -= 1
+            self.nodes -= nodes
+            self.condition.notify_all()
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+def get_admission_controller():
+    global _controller
+    options = admission_options()
+    if not options['ENABLED']:
+        return None
+    with _controller_lock:
+        if _controller is None:
+            _controller = AdmissionController(
+                options['MAX_RUNS'],
+                options['MAX_NODES'],
+                options['MAX_QUEUED'],
+                options['QUEUE_TIMEOUT'],
+            )
+        return _controller
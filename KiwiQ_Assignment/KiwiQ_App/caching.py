@@ -0,0 +1,90 @@
+from .models import Run
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+import json
+
+def graph_version_key(graph_id):
+    return f"kiwiq:graph:{graph_id}:version"
+
+def graph_cache_key(graph_id, version, endpoint, *parts):
+    return ":".join(str(part) for part in (f"kiwiq:graph:{graph_id}:v{version}", endpoint) + parts)
+
+def run_cache_key(run_id, endpoint):
+    return f"kiwiq:run:{run_id}:{endpoint}"
+
+def invalidate_graph(graph_id):
+    # Every entry of a graph is keyed under its version, so bumping it drops them all, whatever their parts.
+    try:
+        cache.incr(graph_version_key(graph_id))
+    except ValueError:
+        pass
+
+def render_json(data):
+    return json.dumps(data, cls=DjangoJSONEncoder)
+
+def json_response(body, etag, last_modified=None):
+    response = HttpResponse(body, content_type="application/json")
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+async def cached_graph_response(request, graph, endpoint, render, *etag_parts):
+    """Serve a structural graph endpoint, revalidated against the graph revision.
+
+    ``etag_parts`` carries anything else the response depends on (e.g. the
+    run config islands are computed for). The cached entry stores its ETag so
+    an entry left behind by another process after an update is never served.
+    """
+    etag = quote_etag("-".join(str(part) for part in (graph.id, graph.revision, endpoint) + etag_parts))
+    last_modified = int(graph.updated_at.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        return response
+
+    version = await cache.aget_or_set(graph_version_key(graph.id), 1, timeout=None)
+    key = graph_cache_key(graph.id, version, endpoint, *etag_parts)
+    cached = await cache.aget(key)
+    if cached is not None and cached[0] == etag:
+        body = cached[1]
+    else:
+        body = render_json(await render())
+        await cache.aset(key, (etag, body))
+
+    response = json_response(body, etag, last_modified)
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+async def cached_run_response(request, run_id, endpoint, render):
+    """Serve a run endpoint, revalidated against the revision of the run's graph.
+
+    A run's outputs are deleted when its graph is updated and retention may
+    delete the run itself, so the revision is looked up on every request
+    (raising Run.DoesNotExist once the run is gone) and is part of the ETag.
+    """
+    revision = await (
+        Run.objects.filter(run_id=run_id)
+        .values_list('graph_run_config__graph__revision', flat=True)
+        .aget()
+    )
+    etag = quote_etag(f"{run_id}-{revision}-{endpoint}")
+    response = get_conditional_response(request, etag=etag)
+    if response is not None:
+        return response
+
+    key = run_cache_key(run_id, endpoint)
+    cached = await cache.aget(key)
+    if cached is not None and cached[0] == etag:
+        body = cached[1]
+    else:
+        body = render_json(await render())
+        await cache.aset(key, (etag, body))
+
+    response = json_response(body, etag)
+    patch_cache_control(response, no_cache=True)
+    return response
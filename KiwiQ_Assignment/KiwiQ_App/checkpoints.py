@@ -0,0 +1,125 @@
+from .models import Run, RunCheckpoint, RunLease
+from .writer import write_run
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.utils import timezone
+from datetime import timedelta
+import threading
+import time
+
+DEFAULT_CHECKPOINTS = {
+    'ENABLED': False,
+    'EVERY_NODES': 10000,
+    'EVERY_SECONDS': 60,
+    'SPILL_NODES': 50000,
+    'HEARTBEAT_SECONDS': 10,
+    'STALE_SECONDS': 60,
+}
+
+
+def checkpoint_options():
+    return {**DEFAULT_CHECKPOINTS, **getattr(settings, 'RUN_CHECKPOINTS', {})}
+
+def save_checkpoint(checkpoint, owner):
+    checkpoint.save()
+    RunLease.objects.update_or_create(
+        run_id=checkpoint.run_id, defaults={"owner": owner, "heartbeat_at": timezone.now()}
+    )
+
+def discard_checkpoints(run_id):
+    RunCheckpoint.objects.filter(run_id=run_id).delete()
+    RunLease.objects.filter(run_id=run_id).delete()
+
+def live_leases(stale_seconds=None):
+    if stale_seconds is None:
+        stale_seconds = checkpoint_options()['STALE_SECONDS']
+    return RunLease.objects.filter(heartbeat_at__gte=timezone.now() - timedelta(seconds=stale_seconds))
+
+def claim_run(run_id, owner):
+    """Take over the lease of an interrupted run; raises ValidationError while its executor is alive."""
+    if live_leases().filter(run_id=run_id).exclude(owner=owner).exists():
+        raise ValidationError(f"Run {run_id} is still executing.")
+    RunLease.objects.update_or_create(run_id=run_id, defaults={"owner": owner, "heartbeat_at": timezone.now()})
+
+def refresh_lease(run_id, owner):
+    RunLease.objects.filter(run_id=run_id, owner=owner).update(heartbeat_at=timezone.now())
+
+def interrupted_run_ids(stale_seconds=None):
+    """Runs with checkpoints but no saved Run whose executor sent no heartbeat for ``stale_seconds``."""
+    run_ids = (
+        RunCheckpoint.objects.exclude(run_id__in=live_leases(stale_seconds).values('run_id'))
+        .order_by('run_id').values_list('run_id', flat=True).distinct()
+    )
+    finished = set(Run.objects.filter(run_id__in=list(run_ids)).values_list('run_id', flat=True))
+    return [run_id for run_id in run_ids if run_id not in finished]
+
+
+class Heartbeat:
+    """Refreshes a run's lease every HEARTBEAT_SECONDS from a background thread.
+
+    The lease only exists once the run has saved a checkpoint, been resumed
+    or started streaming; until then refreshing it is a no-op.
+    """
+
+    def __init__(self, run_id, owner, every_seconds):
+        self.run_id = run_id
+        self.owner = owner
+        self.every_seconds = every_seconds
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._beat, name=f'heartbeat-{run_id}', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+
+    def _beat(self):
+        try:
+            while not self.stopped.wait(self.every_seconds):
+                write_run(refresh_lease, self.run_id, self.owner)
+        finally:
+            connection.close()
+
+
+class Checkpointer:
+    """Buffers a run's outputs and saves them every EVERY_NODES outputs or EVERY_SECONDS.
+
+    Outputs are only saved when a level has just completed, so in level-order
+    execution every checkpoint ends on a whole level frontier. Resuming does
+    not depend on it: restored outputs are simply taken as computed.
+    """
+
+    def __init__(self, run, revision, every_nodes, every_seconds, owner):
+        self.run = run
+        self.revision = revision
+        self.owner = owner
+        self.every_nodes = every_nodes
+        self.every_seconds = every_seconds
+        self.pending = []
+        self.level = None
+        self.last_saved = time.monotonic()
+        self.saved = False
+
+    def add(self, level, node_pk, output, duration_ms):
+        if self.level is not None and level != self.level and self.due():
+            self.save()
+        self.level = level
+        self.pending.append([node_pk, output, duration_ms])
+
+    def due(self):
+        return len(self.pending) >= self.every_nodes or time.monotonic() - self.last_saved >= self.every_seconds
+
+    def save(self):
+        write_run(save_checkpoint, RunCheckpoint(
+            run_id=self.run.run_id,
+            graph_run_config=self.run.graph_run_config,
+            revision=self.revision,
+            level=self.level,
+            outputs=self.pending,
+        ), self.owner)
+        self.pending = []
+        self.last_saved = time.monotonic()
+        self.saved = True
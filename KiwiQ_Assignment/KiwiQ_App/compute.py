@@ -0,0 +1,86 @@
+from django.core.exceptions import ValidationError
+
+# Node evaluation semantics, kept free of models and settings so that worker
+# processes can import it without setting up Django.
+
+
+def reduce_sum(values):
+    if len(values) == 1:
+        return values[0]
+    return sum(values)
+
+def reduce_last(values):
+    return values[-1]
+
+REDUCERS = {
+    'sum': reduce_sum,
+    'list': list,
+    'last': reduce_last,
+    'max': max,
+}
+DEFAULT_REDUCER = 'sum'
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class OutputLookup:
+    """Index-style access to a sparse {index: output} dict, None for missing indexes."""
+
+    __slots__ = ('outputs',)
+
+    def __init__(self, outputs):
+        self.outputs = outputs
+
+    def __getitem__(self, i):
+        return self.outputs.get(i)
+
+
+def evaluate_node(node_id, is_root, data_out, gather, reducers, root_input, overwrite, outputs, node_ids):
+    """Compute one node's output.
+
+    ``outputs[src]`` is the output of source index ``src`` (None when it was
+    not executed) and ``node_ids[src]`` its node_id, used in error messages.
+    Each data_out key adds its reduced input to its constant when both are
+    numbers; a non-numeric reduced input replaces the constant.
+    """
+    if is_root:
+        output = {}
+        for key, value in root_input.items():
+            output[key] = value
+        for key, value in overwrite.items():
+            output[key] = value
+        return output
+
+    gathered = {}
+    for key, value in overwrite.items():
+        gathered[key] = [value]
+    for src, src_key, dst_key in gather:
+        src_output = outputs[src]
+        src_value = src_output.get(src_key) if src_output is not None else None
+        if src_value is None:
+            raise ValidationError(f"Missing input from node '{node_ids[src]}' for node '{node_id}'.")
+        if dst_key in gathered:
+            gathered[dst_key].append(src_value)
+        else:
+            gathered[dst_key] = [src_value]
+
+    inputs = {}
+    for key, values in gathered.items():
+        try:
+            inputs[key] = reducers.get(key, reduce_sum)(values)
+        except TypeError as e:
+            raise ValidationError(f"Cannot reduce input '{key}' for node '{node_id}': {e}")
+
+    output = {}
+    for key, value in data_out.items():
+        input_value = inputs.get(key, 0)
+        if isinstance(input_value, (int, float)) and isinstance(value, (int, float)):
+            output[key] = input_value + value
+        elif key in inputs and not isinstance(input_value, (int, float)):
+            # A non-numeric reduction (e.g. ``list``) replaces the node's constant.
+            output[key] = input_value
+        else:
+            output[key] = value
+    return output
@@ -0,0 +1,120 @@
+from .models import RunOutput
+from .compute import is_number
+from .plans import get_plan
+from .storage import decode_data_out
+from django.core.exceptions import ValidationError
+from itertools import groupby
+import heapq
+
+# Above this many dirty nodes the outputs of both runs are scanned whole and
+# filtered in Python, keeping the IN clause within SQLite's parameter limit.
+DIRTY_FILTER_LIMIT = 10000
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def dirty_nodes(plan, config_a, config_b):
+    """Indexes of the nodes whose outputs can differ between runs of the two configs.
+
+    Runs of a graph always belong to its current structure (updating a graph
+    replaces its nodes and their outputs), so outputs can only differ
+    downstream of nodes the configs treat differently: different root inputs
+    or overwrites, or enabled in only one of them. This assumes both runs
+    are complete; see ``RunDiff.partial_nodes`` for runs that are not.
+    """
+    if config_a.id == config_b.id:
+        return set()
+    seeds = (
+        set(plan.enabled_indexes(config_a.enable_list, config_a.disable_list))
+        ^ set(plan.enabled_indexes(config_b.enable_list, config_b.disable_list))
+    )
+    for field in ('root_inputs', 'data_overwrites'):
+        values_a = getattr(config_a, field) or {}
+        values_b = getattr(config_b, field) or {}
+        for node_id in values_a.keys() | values_b.keys():
+            if node_id in plan.index and values_a.get(node_id) != values_b.get(node_id):
+                seeds.add(plan.index[node_id])
+
+    dirty = set()
+    stack = list(seeds)
+    while stack:
+        i = stack.pop()
+        if i not in dirty:
+            dirty.add(i)
+            stack.extend(plan.children[i])
+    return dirty
+
+
+class RunDiff:
+    """Per-node, per-key differences from ``run_a`` to ``run_b``; deltas are b - a."""
+
+    def __init__(self, run_a, run_b, tolerance=0.0):
+        graph = run_a.graph_run_config.graph
+        if run_b.graph_run_config.graph_id != graph.id:
+            raise ValidationError("Runs belong to different graphs.")
+        self.run_a = run_a
+        self.run_b = run_b
+        self.graph = graph
+        self.tolerance = tolerance
+        self.plan = get_plan(graph)
+        self.dirty = dirty_nodes(self.plan, run_a.graph_run_config, run_b.graph_run_config)
+        self.dirty |= self.partial_nodes()
+        self.compared_nodes = 0
+
+    def partial_nodes(self):
+        """Indexes of the nodes with an output in only one of the runs.
+
+        Only a partial run (saved from a lazy evaluation) lacks outputs of its
+        config's enabled nodes, so node sets are only read for those.
+        """
+        runs = (self.run_a, self.run_b)
+        if not any(run.partial for run in runs):
+            return set()
+
+        nodes = {run.id: set() for run in runs}
+        rows = RunOutput.objects.filter(run_id__in=list(nodes)).values_list('run_id', 'node_id')
+        for run_pk, node_pk in rows.iterator(chunk_size=DEFAULT_CHUNK_SIZE):
+            nodes[run_pk].add(node_pk)
+        position = dict(zip(self.plan.node_pks, range(len(self.plan))))
+        return {position[node_pk] for node_pk in nodes[self.run_a.id] ^ nodes[self.run_b.id] if node_pk in position}
+
+    def outputs(self, chunk_size=DEFAULT_CHUNK_SIZE):
+        # Both runs in one query, ordered so the two outputs of a node are adjacent.
+        queryset = RunOutput.objects.filter(run_id__in=[self.run_a.id, self.run_b.id])
+        if len(self.dirty) <= DIRTY_FILTER_LIMIT:
+            queryset = queryset.filter(node_id__in=[self.plan.node_pks[i] for i in self.dirty])
+        rows = queryset.order_by('node_id', 'run_id').values_list('node_id', 'run_id', 'data_out', 'data_blob')
+        keys = self.graph.structure.output_keys
+        for node_pk, row in groupby(rows.iterator(chunk_size=chunk_size), key=lambda row: row[0]):
+            data = {}
+            for _, run_pk, data_out, data_blob in row:
+                data[run_pk] = data_out if data_blob is None else decode_data_out(data_blob, keys)
+            yield node_pk, data.get(self.run_a.id), data.get(self.run_b.id)
+
+    def changes(self):
+        if not self.dirty:
+            return
+        position = dict(zip(self.plan.node_pks, range(len(self.plan))))
+        for node_pk, data_a, data_b in self.outputs():
+            i = position.get(node_pk)
+            if i not in self.dirty:
+                continue
+            self.compared_nodes += 1
+            data_a = data_a or {}
+            data_b = data_b or {}
+            for key in sorted(data_a.keys() | data_b.keys()):
+                a = data_a.get(key)
+                b = data_b.get(key)
+                if is_number(a) and is_number(b):
+                    delta = b - a
+                    if abs(delta) <= self.tolerance:
+                        continue
+                elif a == b:
+                    continue
+                else:
+                    delta = None
+                yield {"node": self.plan.node_ids[i], "key": key, "a": a, "b": b, "delta": delta}
+
+    def top_changes(self, k):
+        """The ``k`` numeric changes with the largest absolute delta."""
+        numeric = (change for change in self.changes() if change['delta'] is not None)
+        return heapq.nlargest(k, numeric, key=lambda change: abs(change['delta']))
@@ -0,0 +1,82 @@
+from django.core.serializers.json import DjangoJSONEncoder
+import asyncio
+import json
+import threading
+import time
+
+# In-process pub/sub for run events. Each streamed run gets a channel keeping
+# its full event log, so subscribers arriving late (or reconnecting with
+# Last-Event-ID) replay what they missed before following live events.
+KEEPALIVE_SECONDS = 15
+CLOSED_CHANNEL_TTL = 300
+
+
+class RunChannel:
+    def __init__(self, run_id):
+        self.run_id = run_id
+        self.events = []
+        self.closed_at = None
+        self.condition = threading.Condition()
+
+    def publish(self, event, data):
+        with self.condition:
+            self.events.append((event, data))
+            self.condition.notify_all()
+
+    def close(self):
+        with self.condition:
+            self.closed_at = time.monotonic()
+            self.condition.notify_all()
+
+    def wait(self, index, timeout=KEEPALIVE_SECONDS):
+        """Block until there are events past ``index`` or the channel closes.
+
+        Returns the new events and whether the channel is finished.
+        """
+        with self.condition:
+            if index >= len(self.events) and self.closed_at is None:
+                self.condition.wait(timeout)
+            return self.events[index:], self.closed_at is not None and index >= len(self.events)
+
+    def listen(self, index=0):
+        while True:
+            events, finished = self.wait(index)
+            if finished:
+                return
+            if not events:
+                yield ": keepalive\n\n"
+            for event, data in events:
+                yield format_event(index, event, data)
+                index += 1
+
+    async def alisten(self, index=0):
+        while True:
+            events, finished = await asyncio.to_thread(self.wait, index)
+            if finished:
+                return
+            if not events:
+                yield ": keepalive\n\n"
+            for event, data in events:
+                yield format_event(index, event, data)
+                index += 1
+
+
+def format_event(event_id, event, data):
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n"
+
+
+_channels = {}
+_channels_lock = threading.Lock()
+
+def open_channel(run_id):
+    now = time.monotonic()
+    with _channels_lock:
+        for stale in [key for key, channel in _channels.items()
+                      if channel.closed_at is not None and now - channel.closed_at > CLOSED_CHANNEL_TTL]:
+            del _channels[stale]
+        channel = _channels[run_id] = RunChannel(run_id)
+    return channel
+
+def get_channel(run_id):
+    with _channels_lock:
+        return _channels.get(run_id)
@@ -1,114 +1,297 @@
-from .models import Graph, Node, Edge, Run, RunOutput, GraphRunConfig
+from .models import Graph, Run, RunOutput, GraphRunConfig, RunCheckpoint
+from .plans import get_plan
+from .compute import evaluate_node
+from .sharding import use_sharded_execution, execute_sharded
+from .writer import write_run
+from .storage import compact_storage_enabled, compact_run_outputs
+from .events import open_channel
+from .admission import get_admission_controller
+from .checkpoints import Checkpointer, Heartbeat, checkpoint_options, claim_run, discard_checkpoints
+from .stats import record_run_stats
 from django.core.exceptions import ValidationError
-from collections import defaultdict, deque
-import json
+from django.db import connection
+from collections import defaultdict
+from itertools import chain
+import math
+import threading
+import time
+import uuid
+
+def checkpointed_outputs(run):
+    graph_id = run.graph_run_config.graph_id
+    checkpoints = RunCheckpoint.objects.filter(run_id=run.run_id).order_by('level', 'id').values_list('outputs', flat=True)
+    for outputs in checkpoints.iterator(chunk_size=1):
+        yield [
+            RunOutput(graph_id=graph_id, run=run, node_id=node_pk, data_out=output, duration_ms=duration_ms)
+            for node_pk, output, duration_ms in outputs
+        ]
+
+def save_run(run, run_outputs, graph_id, checkpointed=False):
+    # Checkpointed outputs are copied one checkpoint at a time, within the same transaction.
+    # ``graph_id`` is the structure graph: variants share their template's output key dictionary.
+    run.save()
+    batches = chain(checkpointed_outputs(run), [run_outputs]) if checkpointed else [run_outputs]
+    for batch in batches:
+        record_run_stats(run.graph_run_config.graph_id, run.id, [(output.node_id, output.data_out) for output in batch])
+        if compact_storage_enabled():
+            compact_run_outputs(graph_id, batch)
+        RunOutput.objects.bulk_create(batch)
+    if checkpointed:
+        discard_checkpoints(run.run_id)
+
+def persist_evaluation(graph, run_config, plan, outputs):
+    run = Run(graph_run_config=run_config, partial=True)
+    run_outputs = [
+        RunOutput(graph=graph, run=run, node_id=plan.node_pks[i], data_out=output)
+        for i, output in outputs
+    ]
+    write_run(save_run, run, run_outputs, graph.structure_id)
+    return run.run_id
+
+def resume_run(run_id):
+    checkpoints = list(
+        RunCheckpoint.objects.filter(run_id=run_id).select_related('graph_run_config__graph').order_by('level')
+    )
+    if not checkpoints:
+        raise RunCheckpoint.DoesNotExist
+    if Run.objects.filter(run_id=run_id).exists():
+        write_run(discard_checkpoints, run_id)
+        raise ValidationError(f"Run {run_id} has already completed.")
+    run_config = checkpoints[0].graph_run_config
+    executor = GraphExecutor(run_config.graph, run_config)
+    executor.run = Run(run_id=run_id, graph_run_config=run_config)
+    executor.restore(checkpoints)
+    executor.admit()
+    try:
+        executor.claim()
+    except ValidationError:
+        executor.release()
+        raise
+    return executor.execute()
+
+def replay_run(run):
+    # Returns the new run_id and the nodes whose stored output was not reproduced.
+    executor = GraphExecutor(run.graph_run_config.graph, run.graph_run_config, keep_outputs=True)
+    run_id = executor.execute()
+    mismatched = sorted(
+        output.node.node_id for output in run.outputs.select_related('node__graph')
+        if executor.run_outputs.get(output.node.node_id) != output.get_data_out()
+    )
+    return run_id, mismatched
 
 class GraphExecutor:
-    def __init__(self, graph: Graph, run_config: GraphRunConfig):
+    def __init__(self, graph: Graph, run_config: GraphRunConfig, keep_outputs=False):
         self.graph = graph
         self.run_config = run_config
-        self.run = Run.objects.create(graph_run_config=run_config)
+        self.run = Run(graph_run_config=run_config)
+        # Outputs by node_id, only filled with ``keep_outputs``.
+        self.keep_outputs = keep_outputs
         self.run_outputs = {}
         self.toposort = []
         self.levels = {}
+        self.plan = None
+        self.channel = None
+        self.enabled = None
+        self.admitted = None
+        self.live_outputs = 0
+        self.peak_held_outputs = 0
+        self.restored = {}
+        # Identifies this executor in the lease of a checkpointed, resumed or streamed run.
+        self.owner = uuid.uuid4().hex
+        self.leased = False
 
-    def execute(self):
+    def compile(self):
+        if self.plan is None:
+            self.plan = get_plan(self.graph)
+            self.toposort = self.plan.node_ids
+        return self.plan
+
+    def restore(self, checkpoints):
+        plan = self.compile()
+        position = dict(zip(plan.node_pks, range(len(plan))))
+        for checkpoint in checkpoints:
+            if checkpoint.revision != self.graph.revision:
+                raise ValidationError("The graph was updated after the run was checkpointed; it cannot be resumed.")
+            for node_pk, output, duration_ms in checkpoint.outputs:
+                self.restored[position[node_pk]] = (output, duration_ms)
+
+    def make_checkpointer(self, nodes):
+        # None if the run's outputs are held until it is saved.
+        options = checkpoint_options()
+        if options['ENABLED']:
+            every_seconds = options['EVERY_SECONDS']
+        elif options['SPILL_NODES'] is not None and nodes > options['SPILL_NODES']:
+            every_seconds = math.inf
+        else:
+            return None
+        return Checkpointer(self.run, self.graph.revision, options['EVERY_NODES'], every_seconds, self.owner)
+
+    def claim(self):
+        write_run(claim_run, self.run.run_id, self.owner)
+        self.leased = True
+
+    def execute_streaming(self):
+        # Admitted before the thread starts, so a rejected run is never announced.
+        self.admit()
+        try:
+            # Lets the events endpoint of other worker processes tell the run is executing.
+            self.claim()
+        except Exception:
+            self.release()
+            raise
+        self.channel = open_channel(self.run.run_id)
+        threading.Thread(target=self._execute_streaming, daemon=True).start()
+        return self.channel
+
+    def _execute_streaming(self):
+        try:
+            self.execute()
+        except Exception as e:
+            self.channel.publish('error', {"run_id": self.run.run_id, "error": str(e)})
+        finally:
+            self.channel.close()
+            connection.close()
+
+    def enabled_indexes(self):
+        plan = self.compile()
         enabled_nodes = set()
         if self.run_config.enable_list:
             enabled_nodes = set(self.run_config.enable_list)
         elif self.run_config.disable_list:
-            all_nodes = set(node.node_id for node in self.graph.graph_nodes.all())
-            enabled_nodes = all_nodes - set(self.run_config.disable_list)
+            enabled_nodes = set(plan.node_ids) - set(self.run_config.disable_list)
         else:
-            enabled_nodes = set(node.node_id for node in self.graph.graph_nodes.all())
-
-        self.topological_sort()
-
-        for node_id in self.toposort:
-            if node_id not in enabled_nodes:
-                continue
-            node = Node.objects.get(graph=self.graph, node_id=node_id)
-            if not node.in_edges.exists():
-                outputs = {}
-                if node_id in self.run_config.root_inputs:
-                    for key, value in self.run_config.root_inputs[node_id].items():
-                        outputs[key] = value
-                if node_id in self.run_config.data_overwrites:
-                    for key, value in self.run_config.data_overwrites[node_id].items():
-                        outputs[key] = value
-                RunOutput.objects.create(
-                    run=self.run,
-                    node=node,
-                    data_out=outputs
-                )
-                self.run_outputs[node_id] = outputs
+            enabled_nodes = set(plan.node_ids)
+        return [i for i in plan.level_order if plan.node_ids[i] in enabled_nodes]
+
+    def admit(self):
+        if self.admitted is None:
+            self.enabled = self.enabled_indexes()
+            controller = get_admission_controller()
+            self.admitted = controller.acquire(len(self.enabled)) if controller is not None else 0
+        return self.enabled
+
+    def release(self):
+        if self.admitted is not None:
+            controller = get_admission_controller()
+            if controller is not None:
+                controller.release(self.admitted)
+            self.admitted = None
+
+    def execute(self):
+        started_run = time.perf_counter()
+        plan = self.compile()
+        enabled = self.admit()
+        checkpointer = None
+        heartbeat = None
+        try:
+            remaining = [i for i in enabled if i not in self.restored]
+            if self.channel is None and not self.restored and use_sharded_execution(len(remaining)):
+                results = execute_sharded(plan, remaining, self.run_config)
             else:
-                inputs = {}
-                if node_id in self.run_config.data_overwrites:
-                    for key, value in self.run_config.data_overwrites[node_id].items():
-                        inputs[key] = value
-                for edge in node.in_edges.all():
-                    src_node_id = edge.src_node.node_id
-                    src_output_key = next(iter(edge.src_to_dst_data_keys))
-                    dst_input_key = edge.src_to_dst_data_keys[src_output_key]
-                    src_output = self.run_outputs.get(src_node_id, {}).get(src_output_key, None)
-                    if src_output is None:
-                        raise ValidationError(f"Missing input from node '{src_node_id}' for node '{node_id}'.")
-                    if dst_input_key not in inputs:
-                        inputs[dst_input_key] = src_output
-                    else:
-                        inputs[dst_input_key] += src_output 
-
-                output = {}
-                for key, value in node.data_out.items():
-                    input_value = inputs.get(key, 0)
-                    if isinstance(input_value, (int, float)) and isinstance(value, (int, float)):
-                        output[key] = input_value + value
-                    else:
-                        output[key] = value 
-
-                RunOutput.objects.create(
-                    run=self.run,
-                    node=node,
-                    data_out=output
-                )
-                self.run_outputs[node_id] = output
+                results = self.evaluate(plan, remaining)
+            # Restored outputs stay in their checkpoints until save_run copies them.
+            checkpointer = self.make_checkpointer(len(remaining))
+            if checkpointer is not None or self.leased:
+                # Keeps resume_runs off this run however long a level takes, and shows other workers it is executing.
+                heartbeat = Heartbeat(self.run.run_id, self.owner, checkpoint_options()['HEARTBEAT_SECONDS']).start()
+
+            pending_outputs = []
+            for i, output, duration_ms in results:
+                node_id = plan.node_ids[i]
+                if checkpointer is not None:
+                    checkpointer.add(plan.levels[i], plan.node_pks[i], output, duration_ms)
+                    held = len(checkpointer.pending)
+                else:
+                    pending_outputs.append(RunOutput(
+                        graph=self.graph,
+                        run=self.run,
+                        node_id=plan.node_pks[i],
+                        data_out=output,
+                        duration_ms=duration_ms
+                    ))
+                    held = len(pending_outputs)
+                self.peak_held_outputs = max(self.peak_held_outputs, held + self.live_outputs)
+                if self.keep_outputs:
+                    self.run_outputs[node_id] = output
+                if self.channel is not None:
+                    self.channel.publish('node', {"node": node_id, "level": plan.levels[i], "data_out": output})
 
+            checkpointed = self.leased or (checkpointer is not None and checkpointer.saved)
+            if checkpointer is not None:
+                pending_outputs = [
+                    RunOutput(graph=self.graph, run=self.run, node_id=node_pk, data_out=output, duration_ms=duration_ms)
+                    for node_pk, output, duration_ms in checkpointer.pending
+                ]
+            write_run(save_run, self.run, pending_outputs, self.graph.structure_id, checkpointed)
+        except ValidationError:
+            # Errors in the graph or config would recur on resume.
+            if self.leased or (checkpointer is not None and checkpointer.saved):
+                write_run(discard_checkpoints, self.run.run_id)
+            raise
+        finally:
+            if heartbeat is not None:
+                heartbeat.stop()
+            self.release()
         self.levels = self.get_level_wise_traversal()
+        if self.channel is not None:
+            self.channel.publish('summary', {
+                "run_id": self.run.run_id,
+                "status": "completed",
+                "nodes": len(enabled),
+                "peak_held_outputs": self.peak_held_outputs,
+                "duration_ms": (time.perf_counter() - started_run) * 1000,
+            })
 
         return self.run.run_id
 
-    def topological_sort(self):
-        in_degree = defaultdict(int)
-        adj_list = defaultdict(list)
-        for edge in Edge.objects.filter(src_node__graph=self.graph):
-            adj_list[edge.src_node.node_id].append(edge.dst_node.node_id)
-            in_degree[edge.dst_node.node_id] += 1
-
-        queue = deque([node.node_id for node in self.graph.graph_nodes.all() if in_degree[node.node_id] == 0])
-        sorted_order = []
-
-        while queue:
-            current = queue.popleft()
-            sorted_order.append(current)
-            for neighbor in adj_list[current]:
-                in_degree[neighbor] -= 1
-                if in_degree[neighbor] == 0:
-                    queue.append(neighbor)
+    def evaluate(self, plan, enabled):
+        # Outputs are kept only until every enabled node reading them has been evaluated.
+        root_inputs = self.run_config.root_inputs or {}
+        data_overwrites = self.run_config.data_overwrites or {}
+        outputs_by_index = [None] * len(plan)
+        readers = [0] * len(plan)
+        for i in enabled:
+            for src in plan.sources[i]:
+                readers[src] += 1
+        self.live_outputs = 0
+        for i, (output, _) in self.restored.items():
+            if readers[i]:
+                outputs_by_index[i] = output
+                self.live_outputs += 1
+        current_level = None
 
-        if len(sorted_order) != self.graph.graph_nodes.count():
-            raise ValidationError("Graph contains a cycle.")
+        for i in enabled:
+            node_id = plan.node_ids[i]
+            if self.channel is not None and plan.levels[i] != current_level:
+                current_level = plan.levels[i]
+                self.channel.publish('level', {"level": current_level})
+            started = time.perf_counter()
+            output = evaluate_node(
+                node_id,
+                not plan.parents[i],
+                plan.data_outs[i],
+                plan.gather[i],
+                plan.reducers[i],
+                root_inputs.get(node_id) or {},
+                data_overwrites.get(node_id) or {},
+                outputs_by_index,
+                plan.node_ids,
+            )
+            duration_ms = (time.perf_counter() - started) * 1000
+            for src in plan.sources[i]:
+                readers[src] -= 1
+                if readers[src] == 0 and outputs_by_index[src] is not None:
+                    outputs_by_index[src] = None
+                    self.live_outputs -= 1
+            if readers[i]:
+                outputs_by_index[i] = output
+                self.live_outputs += 1
+            yield i, output, duration_ms
 
-        self.toposort = sorted_order
+    def topological_sort(self):
+        return self.compile().node_ids
 
     def get_level_wise_traversal(self):
         levels = defaultdict(list)
-        node_levels = {}
-        for node_id in self.toposort:
-            node = Node.objects.get(graph=self.graph, node_id=node_id)
-            if not node.in_edges.exists():
-                node_levels[node_id] = 0
-            else:
-                node_levels[node_id] = max([node_levels[edge.src_node.node_id] for edge in node.in_edges.all()]) + 1
-            levels[node_levels[node_id]].append(node_id)
+        levels.update(self.compile().level_wise())
         return levels
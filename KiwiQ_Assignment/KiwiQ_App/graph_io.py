@@ -0,0 +1,154 @@
+from .models import Graph, Node, Edge
+from .validators import GraphValidator
+from .plans import REDUCERS
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, transaction
+import json
+
+# NDJSON graph format: a {"type": "graph", "name", "description"} header line,
+# then one {"type": "node", ...} or {"type": "edge", ...} record per line. A
+# node must appear before any edge that references it.
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def dump_line(record):
+    return json.dumps(record, separators=(',', ':')) + "\n"
+
+def parse_lines(lines):
+    for lineno, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            raise ValidationError(f"Line {lineno}: invalid JSON ({e})")
+        if not isinstance(record, dict):
+            raise ValidationError(f"Line {lineno}: expected a JSON object")
+        yield lineno, record
+
+
+class NDJSONGraphImporter:
+    def __init__(self, graph, chunk_size=DEFAULT_CHUNK_SIZE):
+        self.graph = graph
+        self.chunk_size = chunk_size
+        self.nodes = []
+        self.edges = []
+
+    def add_node(self, lineno, record):
+        try:
+            node_id = record['node_id']
+        except KeyError as e:
+            raise ValidationError(f"Line {lineno}: missing field {e} in node record")
+        for key, reducer in (record.get('reducers') or {}).items():
+            if reducer not in REDUCERS:
+                raise ValidationError(f"Unknown reducer '{reducer}' for key '{key}' on node '{node_id}'.")
+        self.nodes.append(Node(
+            node_id=node_id,
+            data_in=record.get('data_in', {}),
+            data_out=record.get('data_out', {}),
+            reducers=record.get('reducers', {}),
+            graph=self.graph
+        ))
+        if len(self.nodes) >= self.chunk_size:
+            self.flush_nodes()
+
+    def add_edge(self, lineno, record):
+        try:
+            self.edges.append((record['src_node'], record['dst_node'], record.get('src_to_dst_data_keys', {})))
+        except KeyError as e:
+            raise ValidationError(f"Line {lineno}: missing field {e} in edge record")
+        if len(self.edges) >= self.chunk_size:
+            self.flush_edges()
+
+    def flush_nodes(self):
+        if not self.nodes:
+            return
+        try:
+            with transaction.atomic():
+                Node.objects.bulk_create(self.nodes)
+        except IntegrityError:
+            node_ids = [node.node_id for node in self.nodes]
+            existing = self.graph.graph_nodes.filter(node_id__in=node_ids).values_list('node_id', flat=True)
+            duplicates = sorted(set(existing) | {i for i in node_ids if node_ids.count(i) > 1})
+            raise ValidationError(f"Duplicate node_id(s) found within the graph: {', '.join(duplicates)}")
+        self.nodes = []
+
+    def flush_edges(self):
+        # Edges may reference nodes still waiting in the node buffer.
+        self.flush_nodes()
+        if not self.edges:
+            return
+        node_ids = {src for src, _, _ in self.edges} | {dst for _, dst, _ in self.edges}
+        node_pks = dict(self.graph.graph_nodes.filter(node_id__in=node_ids).values_list('node_id', 'id'))
+        edges = []
+        for src_id, dst_id, src_to_dst_data_keys in self.edges:
+            if src_id not in node_pks or dst_id not in node_pks:
+                raise ValidationError(f"Invalid edge with src: {src_id}, dst: {dst_id}")
+            edges.append(Edge(
+                graph=self.graph,
+                src_node_id=node_pks[src_id],
+                dst_node_id=node_pks[dst_id],
+                src_to_dst_data_keys=src_to_dst_data_keys
+            ))
+        try:
+            with transaction.atomic():
+                Edge.objects.bulk_create(edges)
+        except IntegrityError:
+            raise ValidationError("Duplicate edge found within the graph.")
+        self.edges = []
+
+
+def import_ndjson(lines, chunk_size=DEFAULT_CHUNK_SIZE):
+    records = parse_lines(lines)
+    try:
+        lineno, header = next(records)
+    except StopIteration:
+        raise ValidationError("Empty graph import.")
+    if header.get('type') != 'graph' or 'name' not in header:
+        raise ValidationError(f"Line {lineno}: expected a graph header record with a name")
+
+    with transaction.atomic():
+        if Graph.objects.filter(name=header['name']).exists():
+            raise ValidationError(f"Graph with name '{header['name']}' already exists.")
+        graph = Graph.objects.create(name=header['name'], description=header.get('description', ''))
+        importer = NDJSONGraphImporter(graph, chunk_size)
+        for lineno, record in records:
+            record_type = record.get('type')
+            if record_type == 'node':
+                importer.add_node(lineno, record)
+            elif record_type == 'edge':
+                importer.add_edge(lineno, record)
+            else:
+                raise ValidationError(f"Line {lineno}: unknown record type '{record_type}'")
+        importer.flush_edges()
+        graph.refresh_node_flags()
+
+        GraphValidator.validate_graph(graph)
+
+    return graph
+
+
+def export_ndjson(graph, chunk_size=DEFAULT_CHUNK_SIZE):
+    yield dump_line({"type": "graph", "name": graph.name, "description": graph.description})
+    # Variants export as standalone graphs, with their overrides applied.
+    nodes = Node.objects.filter(graph_id=graph.structure_id).order_by('id').values_list('node_id', 'data_in', 'data_out', 'reducers')
+    for node_id, data_in, data_out, reducers in nodes.iterator(chunk_size=chunk_size):
+        yield dump_line({
+            "type": "node",
+            "node_id": node_id,
+            "data_in": data_in,
+            "data_out": graph.node_data_out(node_id, data_out),
+            "reducers": reducers or {},
+        })
+    edges = (
+        Edge.objects.filter(graph_id=graph.structure_id)
+        .order_by('id')
+        .values_list('src_node__node_id', 'dst_node__node_id', 'src_to_dst_data_keys')
+    )
+    for src_id, dst_id, src_to_dst_data_keys in edges.iterator(chunk_size=chunk_size):
+        yield dump_line({
+            "type": "edge",
+            "src_node": src_id,
+            "dst_node": dst_id,
+            "src_to_dst_data_keys": src_to_dst_data_keys,
+        })
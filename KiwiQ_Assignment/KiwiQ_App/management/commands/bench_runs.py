@@ -0,0 +1,69 @@
+from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.db import connection
+from KiwiQ_App.models import Graph
+from KiwiQ_App.serializers import GraphSerializer, GraphRunConfigSerializer
+from KiwiQ_App.executor import GraphExecutor
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+class Command(BaseCommand):
+    help = 'Measure run throughput under N concurrent clients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--clients', type=int, nargs='+', default=[1, 4, 16])
+        parser.add_argument('--runs', type=int, default=50, help='Runs per client')
+        parser.add_argument('--width', type=int, default=10, help='Nodes per level of the benchmark graph')
+        parser.add_argument('--depth', type=int, default=5, help='Levels of the benchmark graph')
+        parser.add_argument('--no-writer', action='store_true', help='Write runs from the client threads directly')
+        parser.add_argument('--spill-every', type=int, default=None,
+                            help='Spool every run\'s outputs to checkpoints every N outputs, as runs over SPILL_NODES do')
+
+    def handle(self, *args, **options):
+        if options['no_writer']:
+            settings.RUN_WRITER = {**getattr(settings, 'RUN_WRITER', {}), 'ENABLED': False}
+        if options['spill_every']:
+            settings.RUN_CHECKPOINTS = {
+                **getattr(settings, 'RUN_CHECKPOINTS', {}), 'ENABLED': False, 'SPILL_NODES': 0, 'EVERY_NODES': options['spill_every'],
+            }
+
+        graph = self.build_graph(options['width'], options['depth'])
+        root_inputs = {f"L0N{i}": {"out": 1} for i in range(options['width'])}
+        try:
+            for clients in options['clients']:
+                elapsed = self.bench(graph, root_inputs, clients, options['runs'])
+                total = clients * options['runs']
+                self.stdout.write(
+                    f"clients={clients:<4} runs={total:<6} elapsed={elapsed:.2f}s throughput={total / elapsed:.1f} runs/s"
+                )
+        finally:
+            graph.delete()
+
+    def build_graph(self, width, depth):
+        name = "BenchmarkGraph"
+        Graph.objects.filter(name=name).delete()
+        nodes = []
+        edges = []
+        for level in range(depth):
+            for i in range(width):
+                node_id = f"L{level}N{i}"
+                nodes.append({"node_id": node_id, "data_in": {"in": 0}, "data_out": {"out": 1}})
+                if level:
+                    for src in {f"L{level - 1}N{i}", f"L{level - 1}N{(i + 1) % width}"}:
+                        edges.append({"src_node": src, "dst_node": node_id, "src_to_dst_data_keys": {"out": "out"}})
+        return GraphSerializer.deserialize({"name": name, "nodes": nodes, "edges": edges})
+
+    def bench(self, graph, root_inputs, clients, runs):
+        def client():
+            try:
+                for _ in range(runs):
+                    run_config = GraphRunConfigSerializer.deserialize(graph, {"root_inputs": root_inputs})
+                    GraphExecutor(graph, run_config).execute()
+            finally:
+                connection.close()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            for future in [pool.submit(client) for _ in range(clients)]:
+                future.result()
+        return time.perf_counter() - start
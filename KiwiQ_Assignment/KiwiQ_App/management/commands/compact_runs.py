@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from KiwiQ_App.retention import retention_policy, expired_run_ids, delete_runs, compact_run_configs, open_archive
+from pathlib import Path
+
+class Command(BaseCommand):
+    help = 'Apply the run retention policy: archive and delete old runs, then drop unused run configs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-last', type=int, help='Runs kept per graph (overrides RUN_RETENTION["KEEP_LAST"])')
+        parser.add_argument('--max-age-days', type=int, help='Delete runs older than this (overrides RUN_RETENTION["MAX_AGE_DAYS"])')
+        parser.add_argument('--archive-dir', help='Archive deleted runs here as gzipped NDJSON (overrides RUN_RETENTION["ARCHIVE_DIR"])')
+        parser.add_argument('--chunk-size', type=int, help='Rows deleted per transaction (overrides RUN_RETENTION["CHUNK_SIZE"])')
+        parser.add_argument('--config-grace-hours', type=float, help='Keep unused run configs used more recently than this (overrides RUN_RETENTION["CONFIG_GRACE_HOURS"])')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        policy = retention_policy(
+            KEEP_LAST=options['keep_last'],
+            MAX_AGE_DAYS=options['max_age_days'],
+            ARCHIVE_DIR=options['archive_dir'],
+            CHUNK_SIZE=options['chunk_size'],
+            CONFIG_GRACE_HOURS=options['config_grace_hours'],
+        )
+        run_ids = expired_run_ids(policy)
+        if options['dry_run']:
+            self.stdout.write(f"{len(run_ids)} run(s) would be deleted.")
+            return
+
+        if run_ids and policy['ARCHIVE_DIR']:
+            archive_dir = Path(policy['ARCHIVE_DIR'])
+            archive_dir.mkdir(parents=True, exist_ok=True)
+            path = archive_dir / f"runs-{timezone.now():%Y%m%dT%H%M%S}.ndjson.gz"
+            with open_archive(path, 'w') as archive:
+                deleted = delete_runs(run_ids, policy['CHUNK_SIZE'], archive)
+            self.stdout.write(f"Archived {len(run_ids)} run(s) to {path}")
+        else:
+            deleted = delete_runs(run_ids, policy['CHUNK_SIZE'])
+        self.stdout.write(f"Deleted {deleted} run(s).")
+
+        removed = compact_run_configs(policy['CHUNK_SIZE'], policy['CONFIG_GRACE_HOURS'])
+        self.stdout.write(f"Removed {removed} unused run config(s).")
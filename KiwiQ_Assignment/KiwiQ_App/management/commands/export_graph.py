@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from KiwiQ_App.models import Graph
+from KiwiQ_App.graph_io import export_ndjson, DEFAULT_CHUNK_SIZE
+import sys
+
+class Command(BaseCommand):
+    help = 'Export a graph as NDJSON, streaming it in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('graph_id', type=int)
+        parser.add_argument('--output', default='-', help="File to write, or '-' for stdout")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows fetched per query')
+
+    def handle(self, *args, **options):
+        try:
+            graph = Graph.objects.get(id=options['graph_id'])
+        except Graph.DoesNotExist:
+            raise CommandError(f"Graph with id {options['graph_id']} does not exist.")
+
+        if options['output'] == '-':
+            sys.stdout.writelines(export_ndjson(graph, options['chunk_size']))
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.writelines(export_ndjson(graph, options['chunk_size']))
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.exceptions import ValidationError
+from KiwiQ_App.graph_io import import_ndjson, DEFAULT_CHUNK_SIZE
+import sys
+
+class Command(BaseCommand):
+    help = 'Import a graph from an NDJSON file, streaming it in chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="NDJSON file to import, or '-' for stdin")
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='Rows inserted per bulk insert')
+
+    def handle(self, *args, **options):
+        try:
+            if options['path'] == '-':
+                graph = import_ndjson(sys.stdin, options['chunk_size'])
+            else:
+                with open(options['path'], encoding='utf-8') as f:
+                    graph = import_ndjson(f, options['chunk_size'])
+        except ValidationError as e:
+            raise CommandError(f"Error importing graph: {e}")
+        self.stdout.write(f"Graph '{graph.name}' imported with ID: {graph.id}")
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from KiwiQ_App.retention import retention_policy, restore_runs, open_archive
+
+class Command(BaseCommand):
+    help = 'Re-import runs from archives written by compact_runs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archives', nargs='+', help='Gzipped NDJSON archive files')
+        parser.add_argument('--chunk-size', type=int, help='Runs imported per transaction')
+
+    def handle(self, *args, **options):
+        chunk_size = retention_policy(CHUNK_SIZE=options['chunk_size'])['CHUNK_SIZE']
+        for path in options['archives']:
+            with open_archive(path, 'r') as archive:
+                restored, skipped = restore_runs(archive, chunk_size)
+            self.stdout.write(f"{path}: restored {restored} run(s), skipped {skipped}.")
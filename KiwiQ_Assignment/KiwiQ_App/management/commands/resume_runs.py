@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.core.exceptions import ValidationError
+from KiwiQ_App.models import RunCheckpoint
+from KiwiQ_App.checkpoints import interrupted_run_ids
+from KiwiQ_App.executor import resume_run
+
+class Command(BaseCommand):
+    help = 'Resume runs interrupted after a checkpoint, e.g. after a restart'
+
+    def add_arguments(self, parser):
+        parser.add_argument('run_ids', nargs='*', help='Runs to resume (default: every interrupted run)')
+        parser.add_argument('--stale-seconds', type=int, default=None,
+                            help='Only pick runs without a heartbeat for this many seconds '
+                                 '(default: RUN_CHECKPOINTS STALE_SECONDS)')
+
+    def handle(self, *args, **options):
+        run_ids = options['run_ids'] or interrupted_run_ids(options['stale_seconds'])
+        resumed = 0
+        for run_id in run_ids:
+            try:
+                resume_run(run_id)
+            except RunCheckpoint.DoesNotExist:
+                self.stderr.write(f"Run {run_id} has no checkpoint.")
+                continue
+            except ValidationError as e:
+                self.stderr.write(f"Run {run_id} could not be resumed: {e}")
+                continue
+            resumed += 1
+            self.stdout.write(f"Resumed run {run_id}")
+        self.stdout.write(f"Resumed {resumed} of {len(run_ids)} run(s).")
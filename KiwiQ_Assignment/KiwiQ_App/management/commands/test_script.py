@@ -137,7 +137,7 @@ class Command(BaseCommand):
             run = Run.objects.get(run_id=run_id)
             outputs = RunOutput.objects.filter(run=run)
             for output in outputs:
-                print(f"Node {output.node.node_id} output: {output.data_out}")
+                print(f"Node {output.node.node_id} output: {output.get_data_out()}")
         except Run.DoesNotExist:
             print("Run not found.")
         except Exception as e:
@@ -149,7 +149,7 @@ class Command(BaseCommand):
         try:
             # Leaf node is D
             run_output = RunOutput.objects.get(run=run, node__node_id="D")
-            print(f"Leaf node D output: {run_output.data_out}")
+            print(f"Leaf node D output: {run_output.get_data_out()}")
         except RunOutput.DoesNotExist:
             print("Run output for node D not found.")
         except Exception as e:
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from KiwiQ_App.warmup import DEFERRED_MODULES, warmup_options, warm_up, cold_import_ms
+
+class Command(BaseCommand):
+    help = (
+        'Measure cold start: import the request path and compile the plans of the most recently run graphs, '
+        'as workers do on startup with WARMUP["ON_STARTUP"]'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--graphs', type=int, help='Number of recently run graphs (overrides WARMUP["GRAPHS"])')
+        parser.add_argument('--no-cold-imports', action='store_true', help='Skip timing imports in a fresh interpreter')
+
+    def handle(self, *args, **options):
+        limit = options['graphs'] or warmup_options()['GRAPHS']
+        if not options['no_cold_imports']:
+            # This command has already loaded most of the request path, so
+            # import times are measured in fresh interpreters.
+            for module in ('KiwiQ_App.views',) + DEFERRED_MODULES:
+                self.stdout.write(f"Fresh interpreter: importing {module} takes {cold_import_ms(module):.1f} ms")
+        report = warm_up(limit)
+        self.stdout.write(f"Imported {report['modules']} module(s) of the request path in {report['imports_ms']:.1f} ms")
+        self.stdout.write(f"Compiled {report['plans']} plan(s) in {report['plans_ms']:.1f} ms")
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('KiwiQ_App', '0003_alter_node_node_id_alter_node_unique_together'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='reducers',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('KiwiQ_App', '0004_node_reducers'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graph',
+            name='revision',
+            field=models.PositiveIntegerField(default=1),
+        ),
+        migrations.AddField(
+            model_name='graph',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
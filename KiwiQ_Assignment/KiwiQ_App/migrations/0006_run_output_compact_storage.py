@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('KiwiQ_App', '0005_graph_revision'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graph',
+            name='output_keys',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.AddField(
+            model_name='runoutput',
+            name='data_blob',
+            field=models.BinaryField(blank=True, null=True),
+        ),
+        migrations.AlterField(
+            model_name='runoutput',
+            name='data_out',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
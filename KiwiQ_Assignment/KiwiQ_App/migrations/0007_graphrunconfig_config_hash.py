@@ -0,0 +1,57 @@
+from django.db import migrations, models
+import hashlib
+import json
+
+
+def config_hash(config):
+    canonical = json.dumps(
+        {
+            "root_inputs": config.root_inputs or {},
+            "data_overwrites": config.data_overwrites or {},
+            "enable_list": config.enable_list or [],
+            "disable_list": config.disable_list or [],
+        },
+        sort_keys=True,
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def deduplicate_configs(apps, schema_editor):
+    GraphRunConfig = apps.get_model('KiwiQ_App', 'GraphRunConfig')
+    Run = apps.get_model('KiwiQ_App', 'Run')
+    keep = {}
+    for config in GraphRunConfig.objects.order_by('id').iterator():
+        key = (config.graph_id, config_hash(config))
+        if key in keep:
+            Run.objects.filter(graph_run_config_id=config.id).update(graph_run_config_id=keep[key])
+            config.delete()
+        else:
+            keep[key] = config.id
+            config.config_hash = key[1]
+            config.save(update_fields=['config_hash'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('KiwiQ_App', '0006_run_output_compact_storage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graphrunconfig',
+            name='config_hash',
+            field=models.CharField(editable=False, max_length=64, null=True),
+        ),
+        migrations.RunPython(deduplicate_configs, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='graphrunconfig',
+            name='config_hash',
+            field=models.CharField(editable=False, max_length=64),
+        ),
+        migrations.AlterUniqueTogether(
+            name='graphrunconfig',
+            unique_together={('graph', 'config_hash')},
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('KiwiQ_App', '0007_graphrunconfig_config_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='runoutput',
+            name='duration_ms',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
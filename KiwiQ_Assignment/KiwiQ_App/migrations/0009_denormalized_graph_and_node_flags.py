@@ -0,0 +1,65 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill(apps, schema_editor):
+    Node = apps.get_model('KiwiQ_App', 'Node')
+    Edge = apps.get_model('KiwiQ_App', 'Edge')
+    RunOutput = apps.get_model('KiwiQ_App', 'RunOutput')
+    node_graph = Node.objects.filter(pk=models.OuterRef('src_node_id')).values('graph_id')
+    Edge.objects.update(graph_id=models.Subquery(node_graph))
+    node_graph = Node.objects.filter(pk=models.OuterRef('node_id')).values('graph_id')
+    RunOutput.objects.update(graph_id=models.Subquery(node_graph))
+    Node.objects.update(
+        is_root=~models.Exists(Edge.objects.filter(dst_node=models.OuterRef('pk'))),
+        is_leaf=~models.Exists(Edge.objects.filter(src_node=models.OuterRef('pk'))),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('KiwiQ_App', '0008_runoutput_duration_ms'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='edge',
+            name='graph',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='graph_edges', to='KiwiQ_App.graph'),
+        ),
+        migrations.AddField(
+            model_name='runoutput',
+            name='graph',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='run_outputs', to='KiwiQ_App.graph'),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='is_root',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='is_leaf',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='edge',
+            name='graph',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='graph_edges', to='KiwiQ_App.graph'),
+        ),
+        migrations.AlterField(
+            model_name='runoutput',
+            name='graph',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='run_outputs', to='KiwiQ_App.graph'),
+        ),
+        migrations.AddIndex(
+            model_name='node',
+            index=models.Index(fields=['graph', 'node_id'], name='node_graph_node_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='runoutput',
+            index=models.Index(fields=['graph', 'node'], name='runoutput_graph_node_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:08
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('KiwiQ_App', '0009_denormalized_graph_and_node_flags'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NodeStatsBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.PositiveIntegerField()),
+                ('runs', models.PositiveIntegerField(default=0)),
+                ('last_run_id', models.BigIntegerField(default=0)),
+                ('keys', models.JSONField(default=dict)),
+                ('node', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stats_buckets', to='KiwiQ_App.node')),
+            ],
+            options={
+                'unique_together': {('node', 'bucket')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('KiwiQ_App', '0010_nodestatsbucket'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_id', models.CharField(db_index=True, max_length=36)),
+                ('revision', models.PositiveIntegerField()),
+                ('level', models.PositiveIntegerField()),
+                ('outputs', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('graph_run_config', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='checkpoints', to='KiwiQ_App.graphrunconfig')),
+            ],
+        ),
+    ]
@@ -0,0 +1,42 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def clear_stats_buckets(apps, schema_editor):
+    # Buckets are now kept per graph; they are rebuilt from the run outputs on the next read.
+    apps.get_model('KiwiQ_App', 'NodeStatsBucket').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('KiwiQ_App', '0011_runcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graph',
+            name='overrides',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AddField(
+            model_name='graph',
+            name='template',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='variants', to='KiwiQ_App.graph'),
+        ),
+        migrations.RunPython(clear_stats_buckets, migrations.RunPython.noop),
+        migrations.AlterUniqueTogether(
+            name='nodestatsbucket',
+            unique_together=set(),
+        ),
+        migrations.AddField(
+            model_name='nodestatsbucket',
+            name='graph',
+            field=models.ForeignKey(default=None, on_delete=django.db.models.deletion.CASCADE, related_name='stats_buckets', to='KiwiQ_App.graph'),
+            preserve_default=False,
+        ),
+        migrations.AlterUniqueTogether(
+            name='nodestatsbucket',
+            unique_together={('graph', 'node', 'bucket')},
+        ),
+    ]
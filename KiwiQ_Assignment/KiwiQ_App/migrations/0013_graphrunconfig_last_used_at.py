@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:24
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('KiwiQ_App', '0012_graph_templates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graphrunconfig',
+            name='last_used_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('KiwiQ_App', '0013_graphrunconfig_last_used_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='graph',
+            name='stats_run_id',
+            field=models.BigIntegerField(default=0),
+        ),
+    ]
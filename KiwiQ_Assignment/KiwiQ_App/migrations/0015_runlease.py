@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('KiwiQ_App', '0014_graph_stats_run_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RunLease',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_id', models.CharField(max_length=36, unique=True)),
+                ('owner', models.CharField(max_length=32)),
+                ('heartbeat_at', models.DateTimeField()),
+            ],
+        ),
+    ]
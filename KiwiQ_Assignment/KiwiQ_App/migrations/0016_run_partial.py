@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 15:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('KiwiQ_App', '0015_runlease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='run',
+            name='partial',
+            field=models.BooleanField(default=False),
+        ),
+    ]
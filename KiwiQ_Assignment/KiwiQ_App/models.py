@@ -1,16 +1,62 @@
 from django.db import models
 from django.core.exceptions import ValidationError
+from django.utils import timezone
+from .storage import decode_data_out
+import hashlib
 import uuid
 import json
 
 def generate_run_id():
     return str(uuid.uuid4())
 
+def generate_config_hash(root_inputs, data_overwrites, enable_list, disable_list):
+    canonical = json.dumps(
+        {
+            "root_inputs": root_inputs or {},
+            "data_overwrites": data_overwrites or {},
+            "enable_list": enable_list or [],
+            "disable_list": disable_list or [],
+        },
+        sort_keys=True,
+        separators=(',', ':'),
+    )
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
 class Graph(models.Model):
     name = models.CharField(max_length=255, unique=True)
     description = models.TextField(blank=True)
     nodes = models.JSONField(null=True, blank=True)  
     edges = models.JSONField(null=True, blank=True)  
+    revision = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+    output_keys = models.JSONField(default=list, blank=True)
+    # A variant has no nodes or edges of its own: it uses its template's and
+    # only stores {node_id: {"data_out": {...}}} overrides merged over them.
+    template = models.ForeignKey('self', null=True, blank=True, related_name='variants', on_delete=models.PROTECT)
+    overrides = models.JSONField(default=dict, blank=True)
+    # Last run whose outputs are folded into the graph's NodeStatsBuckets.
+    stats_run_id = models.BigIntegerField(default=0)
+
+    @property
+    def structure_id(self):
+        return self.template_id or self.id
+
+    @property
+    def structure(self):
+        return self.template if self.template_id else self
+
+    def node_data_out(self, node_id, data_out):
+        override = self.overrides.get(node_id)
+        if not override:
+            return data_out
+        return {**(data_out or {}), **override['data_out']}
+
+    def refresh_node_flags(self):
+        # Called after the graph's edges are written, so reads can filter on the flags instead of joining edges.
+        self.graph_nodes.update(
+            is_root=~models.Exists(Edge.objects.filter(dst_node=models.OuterRef('pk'))),
+            is_leaf=~models.Exists(Edge.objects.filter(src_node=models.OuterRef('pk'))),
+        )
 
     def __str__(self):
         return self.name
@@ -19,15 +65,22 @@ class Node(models.Model):
     node_id = models.CharField(max_length=255)
     data_in = models.JSONField()
     data_out = models.JSONField()
+    reducers = models.JSONField(null=True, blank=True)
     graph = models.ForeignKey(Graph, related_name='graph_nodes', on_delete=models.CASCADE)
+    is_root = models.BooleanField(default=True)
+    is_leaf = models.BooleanField(default=True)
 
     class Meta:
         unique_together = ('node_id', 'graph')
+        indexes = [
+            models.Index(fields=['graph', 'node_id'], name='node_graph_node_id_idx'),
+        ]
 
     def __str__(self):
         return self.node_id
 
 class Edge(models.Model):
+    graph = models.ForeignKey(Graph, related_name='graph_edges', on_delete=models.CASCADE)
     src_node = models.ForeignKey(Node, related_name='out_edges', on_delete=models.CASCADE)
     dst_node = models.ForeignKey(Node, related_name='in_edges', on_delete=models.CASCADE)
     src_to_dst_data_keys = models.JSONField(null=True, blank=True)
@@ -44,11 +97,22 @@ class GraphRunConfig(models.Model):
     data_overwrites = models.JSONField(null=True, blank=True)
     enable_list = models.JSONField(null=True, blank=True)
     disable_list = models.JSONField(null=True, blank=True)
+    config_hash = models.CharField(max_length=64, editable=False)
+    # Set whenever a run starts with this config; its Run row is only written
+    # when execution finishes, so recent use is what protects it from compaction.
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('graph', 'config_hash')
 
     def clean(self):
         if self.enable_list and self.disable_list:
             raise ValidationError("Cannot provide both enable_list and disable_list.")
 
+    def save(self, *args, **kwargs):
+        self.config_hash = generate_config_hash(self.root_inputs, self.data_overwrites, self.enable_list, self.disable_list)
+        super().save(*args, **kwargs)
+
     def __str__(self):
         return f"RunConfig for {self.graph.name} at {self.id}"
 
@@ -56,17 +120,64 @@ class Run(models.Model):
     run_id = models.CharField(max_length=36, unique=True, default=generate_run_id, editable=False)
     graph_run_config = models.ForeignKey(GraphRunConfig, related_name='runs', on_delete=models.CASCADE)
     executed_at = models.DateTimeField(auto_now_add=True)
+    # Set on runs saved from a lazy evaluation, which only hold the evaluated node's ancestors.
+    partial = models.BooleanField(default=False)
 
     def __str__(self):
         return self.run_id
 
+class RunCheckpoint(models.Model):
+    run_id = models.CharField(max_length=36, db_index=True)
+    graph_run_config = models.ForeignKey(GraphRunConfig, related_name='checkpoints', on_delete=models.CASCADE)
+    revision = models.PositiveIntegerField()
+    level = models.PositiveIntegerField()
+    outputs = models.JSONField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Checkpoint of run {self.run_id} at level {self.level}"
+
+class RunLease(models.Model):
+    # Held by the executor of a checkpointed run, which refreshes heartbeat_at while it is alive.
+    run_id = models.CharField(max_length=36, unique=True)
+    owner = models.CharField(max_length=32)
+    heartbeat_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Lease of run {self.run_id} held by {self.owner}"
+
 class RunOutput(models.Model):
+    graph = models.ForeignKey(Graph, related_name='run_outputs', on_delete=models.CASCADE)
     run = models.ForeignKey(Run, related_name='outputs', on_delete=models.CASCADE)
     node = models.ForeignKey(Node, related_name='run_outputs', on_delete=models.CASCADE)
-    data_out = models.JSONField()
+    data_out = models.JSONField(null=True, blank=True)
+    data_blob = models.BinaryField(null=True, blank=True)
+    duration_ms = models.FloatField(null=True, blank=True)
 
     class Meta:
         unique_together = ('run', 'node')
+        indexes = [
+            models.Index(fields=['graph', 'node'], name='runoutput_graph_node_idx'),
+        ]
+
+    def get_data_out(self):
+        if self.data_blob is None:
+            return self.data_out
+        return decode_data_out(self.data_blob, self.node.graph.output_keys)
 
     def __str__(self):
         return f"Output of {self.node.node_id} for run {self.run.run_id}"
+
+class NodeStatsBucket(models.Model):
+    graph = models.ForeignKey(Graph, related_name='stats_buckets', on_delete=models.CASCADE)
+    node = models.ForeignKey(Node, related_name='stats_buckets', on_delete=models.CASCADE)
+    bucket = models.PositiveIntegerField()
+    runs = models.PositiveIntegerField(default=0)
+    last_run_id = models.BigIntegerField(default=0)
+    keys = models.JSONField(default=dict)
+
+    class Meta:
+        unique_together = ('graph', 'node', 'bucket')
+
+    def __str__(self):
+        return f"Stats of {self.node.node_id}, bucket {self.bucket}"
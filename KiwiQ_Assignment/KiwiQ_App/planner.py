@@ -0,0 +1,105 @@
+from .models import Run, RunOutput
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Avg
+
+TIMINGS_CACHE_TIMEOUT = 60
+
+
+def node_timings(graph):
+    """Average duration in ms of each node (by pk) over the graph's recent runs."""
+    key = f"kiwiq:graph:{graph.id}:timings"
+    timings = cache.get(key)
+    if timings is None:
+        recent_runs = Run.objects.filter(graph_run_config__graph=graph).order_by('-id').values_list('id', flat=True)
+        recent_runs = recent_runs[:getattr(settings, 'PLANNER_TIMING_RUNS', 20)]
+        timings = dict(
+            RunOutput.objects.filter(run_id__in=list(recent_runs), duration_ms__isnull=False)
+            .values('node_id')
+            .annotate(avg=Avg('duration_ms'))
+            .values_list('node_id', 'avg')
+        )
+        cache.set(key, timings, TIMINGS_CACHE_TIMEOUT)
+    return timings
+
+
+def plan_execution(plan, config, timings=None):
+    """Work out what executing ``config`` on ``plan`` would do, without running it.
+
+    Mirrors GraphExecutor.execute at the level of output keys: a node is
+    reached when it is enabled and every key it gathers is produced by a
+    reached source. Enabled nodes that are not reached would fail the run.
+    """
+    timings = timings or {}
+    root_inputs = config['root_inputs'] or {}
+    data_overwrites = config['data_overwrites'] or {}
+    if config['enable_list']:
+        enabled = plan.enabled_indexes(enable_list=config['enable_list'])
+    else:
+        enabled = plan.enabled_indexes(disable_list=config['disable_list'])
+
+    output_keys = [None] * len(plan)
+    missing_inputs = []
+    reached = []
+    for i in enabled:
+        node_id = plan.node_ids[i]
+        if not plan.parents[i]:
+            output_keys[i] = set(root_inputs.get(node_id, {})) | set(data_overwrites.get(node_id, {}))
+            reached.append(i)
+            continue
+        missing = [
+            (src, src_key) for src, src_key, _ in plan.gather[i]
+            if output_keys[src] is None or src_key not in output_keys[src]
+        ]
+        if missing:
+            for src, src_key in missing:
+                missing_inputs.append({"node": node_id, "src_node": plan.node_ids[src], "src_key": src_key})
+            continue
+        output_keys[i] = set(plan.data_outs[i])
+        reached.append(i)
+
+    level = {}
+    length = {}
+    cost = {}
+    previous = {}
+    for i in reached:
+        parents = [p for p in plan.parents[i] if p in level]
+        level[i] = max((level[p] for p in parents), default=-1) + 1
+        duration = timings.get(plan.node_pks[i], 0.0)
+        if parents:
+            longest = max(parents, key=lambda p: (cost[p], length[p]))
+            previous[i] = longest
+            length[i] = length[longest] + 1
+            cost[i] = cost[longest] + duration
+        else:
+            length[i] = 1
+            cost[i] = duration
+
+    levels = {}
+    for i in reached:
+        levels.setdefault(level[i], []).append(plan.node_ids[i])
+
+    critical_path = []
+    if reached:
+        current = max(reached, key=lambda i: (cost[i], length[i]))
+        while current is not None:
+            critical_path.append(plan.node_ids[current])
+            current = previous.get(current)
+        critical_path.reverse()
+
+    reached_set = set(reached)
+    return {
+        "enabled_nodes": [plan.node_ids[i] for i in enabled],
+        "reached_nodes": [plan.node_ids[i] for i in reached],
+        "unreached_nodes": [plan.node_ids[i] for i in enabled if i not in reached_set],
+        "missing_inputs": missing_inputs,
+        "levels": dict(sorted(levels.items())),
+        "max_parallel_width": max((len(nodes) for nodes in levels.values()), default=0),
+        "critical_path_length": len(critical_path),
+        "critical_path": critical_path,
+        "estimated_cost_ms": {
+            "total": sum(timings.get(plan.node_pks[i], 0.0) for i in reached),
+            "critical_path": max(cost.values(), default=0.0),
+            "nodes_without_timings": sum(1 for i in reached if plan.node_pks[i] not in timings),
+        },
+    }
@@ -0,0 +1,292 @@
+from .models import Edge
+from .compute import REDUCERS, DEFAULT_REDUCER, OutputLookup, evaluate_node
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from collections import OrderedDict, deque
+import copy
+import hashlib
+import threading
+
+
+def get_reducer(name):
+    try:
+        return REDUCERS[name]
+    except KeyError:
+        raise ValidationError(f"Unknown reducer '{name}'. Expected one of: {', '.join(REDUCERS)}")
+
+
+class DataOuts:
+    """A variant's data_outs: its template's list with a few indexes overridden."""
+
+    __slots__ = ('base', 'overrides')
+
+    def __init__(self, base, overrides):
+        self.base = base
+        self.overrides = overrides
+
+    def __getitem__(self, i):
+        override = self.overrides.get(i)
+        return self.base[i] if override is None else override
+
+    def __len__(self):
+        return len(self.base)
+
+
+class GraphPlan:
+    """Graph structure compiled once into integer-indexed lists.
+
+    Nodes are stored in topological order, so a node's index is also its
+    position in the toposort. ``gather[i]`` holds the (src index, src key,
+    dst key) triples feeding node ``i`` and ``reducers[i]`` maps each of its
+    destination keys to the reducer merging the gathered values.
+    """
+
+    def __init__(self, node_ids, node_pks, data_outs, parents, children, gather, reducers):
+        self.node_ids = node_ids
+        self.node_pks = node_pks
+        self.data_outs = data_outs
+        self.parents = parents
+        self.children = children
+        self.gather = gather
+        self.reducers = reducers
+        self.index = {node_id: i for i, node_id in enumerate(node_ids)}
+        # Distinct source indexes whose outputs node i gathers from.
+        self.sources = [sorted({src for src, _, _ in triples}) for triples in gather]
+        self.levels = self._compute_levels()
+        self.level_order = sorted(range(len(node_ids)), key=lambda i: (self.levels[i], i))
+        self.islands_cache = OrderedDict()
+        self.evaluations = OrderedDict()
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def derive(self, overrides):
+        """Plan of a variant graph, sharing this plan's structure and islands cache."""
+        plan = copy.copy(self)
+        plan.data_outs = DataOuts(self.data_outs, {
+            self.index[node_id]: {**self.data_outs[self.index[node_id]], **override['data_out']}
+            for node_id, override in overrides.items() if node_id in self.index
+        })
+        plan.evaluations = OrderedDict()
+        return plan
+
+    def _compute_levels(self):
+        levels = [0] * len(self.node_ids)
+        for i, parents in enumerate(self.parents):
+            if parents:
+                levels[i] = max(levels[p] for p in parents) + 1
+        return levels
+
+    def level_wise(self):
+        levels = {}
+        for i, level in enumerate(self.levels):
+            levels.setdefault(level, []).append(self.node_ids[i])
+        return levels
+
+    def components(self, enabled):
+        # Union-find over weakly connected components of the enabled subgraph.
+        # Components come out ordered by their first index, with their indexes
+        # in topological order.
+        parent = list(range(len(self.node_ids)))
+
+        def find(x):
+            while parent[x] != x:
+                parent[x] = parent[parent[x]]
+                x = parent[x]
+            return x
+
+        is_enabled = [False] * len(self.node_ids)
+        for i in enabled:
+            is_enabled[i] = True
+        for src in enabled:
+            for dst in self.children[src]:
+                if is_enabled[dst]:
+                    a, b = find(src), find(dst)
+                    if a != b:
+                        parent[max(a, b)] = min(a, b)
+
+        components = {}
+        for i in enabled:
+            components.setdefault(find(i), []).append(i)
+        return list(components.values())
+
+    def enabled_indexes(self, enable_list=None, disable_list=None):
+        if enable_list:
+            enabled = {self.index[node_id] for node_id in enable_list if node_id in self.index}
+        else:
+            enabled = set(range(len(self.node_ids)))
+        if disable_list:
+            enabled -= {self.index[node_id] for node_id in disable_list if node_id in self.index}
+        return sorted(enabled)
+
+    def islands(self, enable_list=None, disable_list=None):
+        enabled = self.enabled_indexes(enable_list, disable_list)
+        key = hashlib.blake2b(",".join(map(str, enabled)).encode(), digest_size=16).hexdigest()
+        islands = self.islands_cache.get(key)
+        if islands is None:
+            islands = self._compute_islands(enabled)
+            self.islands_cache[key] = islands
+            if len(self.islands_cache) > ISLANDS_CACHE_SIZE:
+                self.islands_cache.popitem(last=False)
+        return islands
+
+    def _compute_islands(self, enabled):
+        return [[self.node_ids[i] for i in component] for component in self.components(enabled)]
+
+    def evaluation(self, config_hash, config):
+        """Memo of node outputs for one run config, shared by lazy evaluations.
+
+        Configs are content-addressed and the plan is tied to one graph
+        revision, so a memoized output stays valid for the plan's lifetime.
+        """
+        memo = self.evaluations.get(config_hash)
+        if memo is None:
+            memo = {
+                "config": config,
+                "enabled": set(self.enabled_indexes(config['enable_list'], config['disable_list'])),
+                "outputs": {},
+            }
+            self.evaluations[config_hash] = memo
+            if len(self.evaluations) > EVALUATION_CACHE_SIZE:
+                self.evaluations.popitem(last=False)
+        return memo
+
+    def ancestor_cone(self, target, enabled):
+        # Enabled nodes whose values flow into ``target``, in topological order.
+        cone = set()
+        stack = [target]
+        while stack:
+            i = stack.pop()
+            if i in cone or i not in enabled:
+                continue
+            cone.add(i)
+            stack.extend(src for src, _, _ in self.gather[i])
+        return sorted(cone)
+
+    def evaluate_lazy(self, node_id, config_hash, config):
+        """Evaluate one node, computing only the part of its ancestor cone not memoized yet.
+
+        Returns the output and the number of nodes computed for this call.
+        """
+        target = self.index[node_id]
+        memo = self.evaluation(config_hash, config)
+        if target not in memo['enabled']:
+            raise ValidationError(f"Node '{node_id}' is not enabled in this run configuration.")
+        outputs = memo['outputs']
+        if target in outputs:
+            return outputs[target], 0
+
+        root_inputs = config['root_inputs'] or {}
+        data_overwrites = config['data_overwrites'] or {}
+        lookup = OutputLookup(outputs)
+        computed = 0
+        for i in self.ancestor_cone(target, memo['enabled']):
+            if i in outputs:
+                continue
+            outputs[i] = evaluate_node(
+                self.node_ids[i],
+                not self.parents[i],
+                self.data_outs[i],
+                self.gather[i],
+                self.reducers[i],
+                root_inputs.get(self.node_ids[i]) or {},
+                data_overwrites.get(self.node_ids[i]) or {},
+                lookup,
+                self.node_ids,
+            )
+            computed += 1
+        return outputs[target], computed
+
+
+ISLANDS_CACHE_SIZE = 128
+EVALUATION_CACHE_SIZE = 32
+
+_plans = OrderedDict()
+_plans_lock = threading.Lock()
+
+def get_plan(graph):
+    """Return the compiled plan of ``graph``, reusing it while the revision is unchanged.
+
+    Variants derive theirs from their template's plan; updating a template
+    bumps the revision of its variants.
+    """
+    key = (graph.id, graph.revision)
+    with _plans_lock:
+        plan = _plans.get(key)
+        if plan is not None:
+            _plans.move_to_end(key)
+            return plan
+
+    if graph.template_id:
+        plan = get_plan(graph.template).derive(graph.overrides)
+    else:
+        plan = compile_graph(graph)
+    with _plans_lock:
+        _plans[key] = plan
+        for stale in [k for k in _plans if k[0] == graph.id and k != key]:
+            del _plans[stale]
+        while len(_plans) > getattr(settings, 'PLAN_CACHE_SIZE', 64):
+            _plans.popitem(last=False)
+    return plan
+
+def compile_graph(graph):
+    nodes = list(graph.graph_nodes.order_by('id').values_list('id', 'node_id', 'data_out', 'reducers'))
+    edges = list(
+        Edge.objects.filter(graph=graph)
+        .order_by('id')
+        .values_list('src_node_id', 'dst_node_id', 'src_to_dst_data_keys')
+    )
+
+    position = {pk: i for i, (pk, _, _, _) in enumerate(nodes)}
+    in_degree = [0] * len(nodes)
+    adj_list = [[] for _ in nodes]
+    for src_pk, dst_pk, _ in edges:
+        adj_list[position[src_pk]].append(position[dst_pk])
+        in_degree[position[dst_pk]] += 1
+
+    queue = deque(i for i, degree in enumerate(in_degree) if degree == 0)
+    order = []
+    while queue:
+        current = queue.popleft()
+        order.append(current)
+        for neighbor in adj_list[current]:
+            in_degree[neighbor] -= 1
+            if in_degree[neighbor] == 0:
+                queue.append(neighbor)
+
+    if len(order) != len(nodes):
+        raise ValidationError("Graph contains a cycle.")
+
+    rank = {pos: i for i, pos in enumerate(order)}
+    node_ids = [nodes[pos][1] for pos in order]
+    node_pks = [nodes[pos][0] for pos in order]
+    data_outs = [nodes[pos][2] or {} for pos in order]
+    parents = [[] for _ in order]
+    children = [[] for _ in order]
+    gather = [[] for _ in order]
+
+    for src_pk, dst_pk, keys in edges:
+        src = rank[position[src_pk]]
+        dst = rank[position[dst_pk]]
+        parents[dst].append(src)
+        children[src].append(dst)
+        for src_key, dst_key in (keys or {}).items():
+            gather[dst].append((src, src_key, dst_key))
+
+    reducers = []
+    for i, pos in enumerate(order):
+        declared = nodes[pos][3] or {}
+        reducers.append({
+            dst_key: get_reducer(declared.get(dst_key, DEFAULT_REDUCER))
+            for _, _, dst_key in gather[i]
+        })
+
+    return GraphPlan(
+        node_ids=node_ids,
+        node_pks=node_pks,
+        data_outs=data_outs,
+        parents=[tuple(p) for p in parents],
+        children=[tuple(c) for c in children],
+        gather=[tuple(g) for g in gather],
+        reducers=reducers,
+    )
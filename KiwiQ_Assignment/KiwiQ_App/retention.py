@@ -0,0 +1,138 @@
+from .models import Graph, GraphRunConfig, Run, RunOutput, generate_config_hash
+from .storage import compact_storage_enabled, compact_run_outputs
+from .stats import record_run_stats
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from datetime import timedelta
+import gzip
+import json
+
+DEFAULT_RETENTION = {
+    'KEEP_LAST': None,
+    'MAX_AGE_DAYS': None,
+    'ARCHIVE_DIR': None,
+    'CHUNK_SIZE': 500,
+    'CONFIG_GRACE_HOURS': 24,
+}
+CONFIG_FIELDS = ('root_inputs', 'data_overwrites', 'enable_list', 'disable_list')
+
+
+def retention_policy(**overrides):
+    policy = {**DEFAULT_RETENTION, **getattr(settings, 'RUN_RETENTION', {})}
+    policy.update({key: value for key, value in overrides.items() if value is not None})
+    return policy
+
+def chunked(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def expired_run_ids(policy):
+    expired = set()
+    if policy['MAX_AGE_DAYS'] is not None:
+        cutoff = timezone.now() - timedelta(days=policy['MAX_AGE_DAYS'])
+        expired.update(Run.objects.filter(executed_at__lt=cutoff).values_list('id', flat=True))
+    if policy['KEEP_LAST'] is not None:
+        # Only complete runs count; partial runs older than the last one kept go with it.
+        for graph_id in Graph.objects.values_list('id', flat=True):
+            runs = Run.objects.filter(graph_run_config__graph_id=graph_id)
+            kept = list(runs.filter(partial=False).order_by('-id').values_list('id', flat=True)[:policy['KEEP_LAST']])
+            if len(kept) == policy['KEEP_LAST']:
+                older = runs.filter(id__lt=kept[-1]) if kept else runs
+                expired.update(older.values_list('id', flat=True))
+    return sorted(expired)
+
+
+def archive_records(run_ids):
+    outputs = {}
+    for run_output in RunOutput.objects.filter(run_id__in=run_ids).select_related('node__graph').order_by('id'):
+        outputs.setdefault(run_output.run_id, {})[run_output.node.node_id] = run_output.get_data_out()
+
+    for run in Run.objects.filter(id__in=run_ids).select_related('graph_run_config__graph').order_by('id'):
+        config = run.graph_run_config
+        yield {
+            "run_id": run.run_id,
+            "graph_id": config.graph_id,
+            "graph_name": config.graph.name,
+            "executed_at": run.executed_at.isoformat(),
+            "partial": run.partial,
+            "config": {field: getattr(config, field) for field in CONFIG_FIELDS},
+            "outputs": outputs.get(run.id, {}),
+        }
+
+def delete_runs(run_ids, chunk_size, archive=None):
+    deleted = 0
+    for chunk in chunked(run_ids, chunk_size):
+        if archive is not None:
+            for record in archive_records(chunk):
+                archive.write(json.dumps(record, separators=(',', ':')) + "\n")
+        with transaction.atomic():
+            RunOutput.objects.filter(run_id__in=chunk).delete()
+            deleted += Run.objects.filter(id__in=chunk).delete()[0]
+    return deleted
+
+
+def compact_run_configs(chunk_size, grace_hours):
+    # Configs are unique per graph and content hash, so only unused ones remain to drop.
+    # A run in progress has no Run row yet, so configs used within the grace period
+    # are kept, and so are those with checkpoints, which deleting them would cascade to.
+    cutoff = timezone.now() - timedelta(hours=grace_hours)
+    unused = GraphRunConfig.objects.filter(runs__isnull=True, checkpoints__isnull=True, last_used_at__lt=cutoff)
+    removed = 0
+    for chunk in chunked(list(unused.values_list('id', flat=True)), chunk_size):
+        with transaction.atomic():
+            removed += unused.filter(id__in=chunk).delete()[0]
+    return removed
+
+
+def restore_runs(lines, chunk_size):
+    restored = 0
+    skipped = 0
+    records = (json.loads(line) for line in lines if line.strip())
+    batch = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= chunk_size:
+            counts = restore_batch(batch)
+            restored, skipped, batch = restored + counts[0], skipped + counts[1], []
+    if batch:
+        counts = restore_batch(batch)
+        restored, skipped = restored + counts[0], skipped + counts[1]
+    return restored, skipped
+
+def restore_batch(records):
+    existing = set(Run.objects.filter(run_id__in=[r['run_id'] for r in records]).values_list('run_id', flat=True))
+    restored = 0
+    with transaction.atomic():
+        for record in records:
+            if record['run_id'] in existing:
+                continue
+            try:
+                graph = Graph.objects.get(id=record['graph_id'], name=record['graph_name'])
+            except Graph.DoesNotExist:
+                continue
+            node_map = dict(graph.structure.graph_nodes.filter(node_id__in=record['outputs']).values_list('node_id', 'id'))
+            if len(node_map) != len(record['outputs']):
+                continue
+            config, _ = GraphRunConfig.objects.get_or_create(
+                graph=graph,
+                config_hash=generate_config_hash(**record['config']),
+                defaults=record['config'],
+            )
+            run = Run.objects.create(run_id=record['run_id'], graph_run_config=config, partial=record.get('partial', False))
+            Run.objects.filter(id=run.id).update(executed_at=parse_datetime(record['executed_at']))
+            run_outputs = [
+                RunOutput(graph=graph, run=run, node_id=node_map[node_id], data_out=data_out)
+                for node_id, data_out in record['outputs'].items()
+            ]
+            record_run_stats(graph.id, run.id, [(output.node_id, output.data_out) for output in run_outputs])
+            if compact_storage_enabled():
+                compact_run_outputs(graph.structure_id, run_outputs)
+            RunOutput.objects.bulk_create(run_outputs)
+            restored += 1
+    return restored, len(records) - restored
+
+def open_archive(path, mode):
+    return gzip.open(path, mode + 't', encoding='utf-8')
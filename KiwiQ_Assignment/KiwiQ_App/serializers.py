@@ -1,17 +1,56 @@
 import json
-from .models import Graph, Node, Edge, GraphRunConfig, Run, RunOutput
+import asyncio
+from .models import Graph, Node, Edge, GraphRunConfig, Run, RunOutput, generate_config_hash
 from django.core.exceptions import ValidationError
 from .validators import GraphValidator
-from collections import Counter
+from .plans import REDUCERS
+from .caching import invalidate_graph
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+from collections import Counter, defaultdict
+
+async def async_list(queryset):
+    return [obj async for obj in queryset]
 
 class GraphSerializer:
     def serialize(graph):
+        nodes = []
+        for node in Node.objects.filter(graph_id=graph.structure_id):
+            serialized_node = NodeSerializer.serialize_node(node)
+            serialized_node["data_out"] = graph.node_data_out(node.node_id, node.data_out)
+            nodes.append(serialized_node)
+        return {
+            "id": graph.id,
+            "name": graph.name,
+            "description": graph.description,
+            "template": graph.template_id,
+            "nodes": nodes,
+            "edges": [EdgeSerializer.serialize_edge(edge) for edge in Edge.objects.filter(graph_id=graph.structure_id)]
+        }
+
+    async def aserialize(graph):
+        nodes, edges = await asyncio.gather(
+            async_list(Node.objects.filter(graph_id=graph.structure_id)),
+            async_list(Edge.objects.filter(graph_id=graph.structure_id).select_related('src_node', 'dst_node')),
+        )
+        for node in nodes:
+            node.data_out = graph.node_data_out(node.node_id, node.data_out)
+        serialized_edges = []
+        paths_in = defaultdict(list)
+        paths_out = defaultdict(list)
+        for edge in edges:
+            serialized_edge = EdgeSerializer.serialize_edge(edge)
+            serialized_edges.append(serialized_edge)
+            paths_in[edge.dst_node_id].append(serialized_edge)
+            paths_out[edge.src_node_id].append(serialized_edge)
         return {
             "id": graph.id,
             "name": graph.name,
             "description": graph.description,
-            "nodes": [NodeSerializer.serialize_node(node) for node in graph.graph_nodes.all()],
-            "edges": [EdgeSerializer.serialize_edge(edge) for edge in Edge.objects.filter(src_node__graph=graph)]
+            "template": graph.template_id,
+            "nodes": [NodeSerializer.serialize_node(node, paths_in[node.id], paths_out[node.id]) for node in nodes],
+            "edges": serialized_edges
         }
 
     def deserialize(data, graph=None):
@@ -28,69 +67,118 @@ class GraphSerializer:
         if duplicates:
             raise ValidationError(f"Duplicate node_id(s) found within the graph: {', '.join(duplicates)}")
 
-        if graph is None:
-            graph = Graph.objects.create(
-                name=name,
-                description=description
-            )
-        else:
-            graph.description = description
-            graph.save()
-
-        if graph.graph_nodes.exists():
-            graph.graph_nodes.all().delete()
-            Edge.objects.filter(src_node__graph=graph).delete()
-
-        node_map = {}
         for node_data in nodes_data:
-            node = Node.objects.create(
-                node_id=node_data['node_id'],
-                data_in=node_data.get('data_in', {}),
-                data_out=node_data.get('data_out', {}),
-                graph=graph
-            )
-            node_map[node.node_id] = node
+            for key, reducer in (node_data.get('reducers') or {}).items():
+                if reducer not in REDUCERS:
+                    raise ValidationError(f"Unknown reducer '{reducer}' for key '{key}' on node '{node_data['node_id']}'.")
 
+        # The whole definition is checked before anything is written.
+        known = set(node_ids)
+        edge_keys = set()
         for edge_data in edges_data:
             src_id = edge_data['src_node']
             dst_id = edge_data['dst_node']
-            src_to_dst_data_keys = edge_data.get('src_to_dst_data_keys', {})
-            src_node = node_map.get(src_id)
-            dst_node = node_map.get(dst_id)
-            if not src_node or not dst_node:
+            if src_id not in known or dst_id not in known:
                 raise ValidationError(f"Invalid edge with src: {src_id}, dst: {dst_id}")
-            Edge.objects.create(
-                src_node=src_node,
-                dst_node=dst_node,
-                src_to_dst_data_keys=src_to_dst_data_keys
-            )
+            edge_key = (src_id, dst_id, json.dumps(edge_data.get('src_to_dst_data_keys', {}), sort_keys=True))
+            if edge_key in edge_keys:
+                raise ValidationError("Duplicate edge found within the graph.")
+            edge_keys.add(edge_key)
+        GraphValidator.validate_definition(node_ids, [(edge_data['src_node'], edge_data['dst_node']) for edge_data in edges_data])
+
+        updating = graph is not None
+        with transaction.atomic():
+            if not updating:
+                graph = Graph.objects.create(
+                    name=name,
+                    description=description
+                )
+            else:
+                graph.description = description
+                if graph.template_id:
+                    # A full definition detaches a variant; its runs point at the template's nodes.
+                    RunOutput.objects.filter(graph=graph).delete()
+                    graph.template = None
+                    graph.overrides = {}
+                graph.save()
 
-        GraphValidator.validate_graph(graph)
+            if graph.graph_nodes.exists():
+                graph.graph_nodes.all().delete()
+                Edge.objects.filter(graph=graph).delete()
+
+            node_map = {}
+            for node_data in nodes_data:
+                node = Node.objects.create(
+                    node_id=node_data['node_id'],
+                    data_in=node_data.get('data_in', {}),
+                    data_out=node_data.get('data_out', {}),
+                    reducers=node_data.get('reducers', {}),
+                    graph=graph
+                )
+                node_map[node.node_id] = node
+
+            for edge_data in edges_data:
+                Edge.objects.create(
+                    graph=graph,
+                    src_node=node_map[edge_data['src_node']],
+                    dst_node=node_map[edge_data['dst_node']],
+                    src_to_dst_data_keys=edge_data.get('src_to_dst_data_keys', {})
+                )
+            graph.refresh_node_flags()
+            if updating:
+                # Bumped last, in the same transaction, so a reader never pairs the new revision with a half-written graph.
+                now = timezone.now()
+                Graph.objects.filter(pk=graph.pk).update(revision=F('revision') + 1, updated_at=now)
+                graph.variants.update(revision=F('revision') + 1, updated_at=now)
+                graph.refresh_from_db(fields=['revision', 'updated_at'])
+                transaction.on_commit(lambda: invalidate_graph(graph.id))
 
         return graph
 
+    def deserialize_variant(base, data):
+        """Create a graph sharing ``base``'s structure, storing only node data_out overrides."""
+        try:
+            name = data['name']
+            description = data.get('description', '')
+            overrides = data.get('overrides', {})
+        except KeyError as e:
+            raise ValidationError(f"Missing field in graph data: {e}")
+        if not isinstance(overrides, dict):
+            raise ValidationError("overrides must map node ids to {\"data_out\": {...}}.")
+        for node_id, override in overrides.items():
+            if not isinstance(override, dict) or set(override) != {'data_out'} or not isinstance(override['data_out'], dict):
+                raise ValidationError(f"Invalid override for node '{node_id}': only data_out can be overridden.")
+
+        # A variant of a variant is stored against the original template.
+        if base.template_id:
+            merged = {node_id: dict(override) for node_id, override in base.overrides.items()}
+            for node_id, override in overrides.items():
+                merged[node_id] = {"data_out": {**merged.get(node_id, {}).get('data_out', {}), **override['data_out']}}
+            overrides = merged
+            base = base.template
+
+        known = set(base.graph_nodes.filter(node_id__in=list(overrides)).values_list('node_id', flat=True))
+        unknown = sorted(set(overrides) - known)
+        if unknown:
+            raise ValidationError(f"Override for unknown node(s): {', '.join(unknown)}")
+        if Graph.objects.filter(name=name).exists():
+            raise ValidationError(f"Graph with name '{name}' already exists.")
+
+        return Graph.objects.create(name=name, description=description, template=base, overrides=overrides)
+
 class NodeSerializer:
-    def serialize_node(node):
+    def serialize_node(node, paths_in=None, paths_out=None):
+        if paths_in is None:
+            paths_in = [EdgeSerializer.serialize_edge(edge) for edge in node.in_edges.all()]
+        if paths_out is None:
+            paths_out = [EdgeSerializer.serialize_edge(edge) for edge in node.out_edges.all()]
         return {
             "node_id": node.node_id,
             "data_in": node.data_in,
             "data_out": node.data_out,
-            "paths_in": [
-                {
-                    "src_node": edge.src_node.node_id,
-                    "dst_node": edge.dst_node.node_id,
-                    "src_to_dst_data_keys": edge.src_to_dst_data_keys
-                }
-                for edge in node.in_edges.all()
-            ],
-            "paths_out": [
-                {
-                    "src_node": edge.src_node.node_id,
-                    "dst_node": edge.dst_node.node_id,
-                    "src_to_dst_data_keys": edge.src_to_dst_data_keys
-                }
-                for edge in node.out_edges.all()
-            ]
+            "reducers": node.reducers or {},
+            "paths_in": paths_in,
+            "paths_out": paths_out
         }
 
 class EdgeSerializer:
@@ -102,7 +190,7 @@ class EdgeSerializer:
         }
 
 class GraphRunConfigSerializer:
-    def deserialize(graph: Graph, data: dict):
+    def parse(data: dict):
         try:
             root_inputs = data.get('root_inputs', {})
             data_overwrites = data.get('data_overwrites', {})
@@ -114,14 +202,25 @@ class GraphRunConfigSerializer:
         if enable_list and disable_list:
             raise ValidationError("Cannot provide both enable_list and disable_list simultaneously.")
 
+        return {
+            "root_inputs": root_inputs,
+            "data_overwrites": data_overwrites,
+            "enable_list": enable_list,
+            "disable_list": disable_list,
+        }
+
+    def deserialize(graph: Graph, data: dict):
+        config = GraphRunConfigSerializer.parse(data)
 
-        run_config = GraphRunConfig.objects.create(
+        # Identical configs share one row, so replayed requests only add Runs.
+        run_config, created = GraphRunConfig.objects.get_or_create(
             graph=graph,
-            root_inputs=root_inputs,
-            data_overwrites=data_overwrites,
-            enable_list=enable_list,
-            disable_list=disable_list
+            config_hash=generate_config_hash(**config),
+            defaults=config
         )
+        if not created:
+            run_config.last_used_at = timezone.now()
+            GraphRunConfig.objects.filter(id=run_config.id).update(last_used_at=run_config.last_used_at)
 
         return run_config
 
@@ -154,7 +253,7 @@ class RunOutputSerializer:
             "id": run_output.id,
             "run": run_output.run.run_id,
             "node": run_output.node.node_id,
-            "data_out": run_output.data_out
+            "data_out": run_output.get_data_out()
         }
 
     def deserialize(data):
@@ -176,6 +275,7 @@ class RunOutputSerializer:
             raise ValidationError(f"Node with node_id {node_id} does not exist in the graph associated with the run.")
 
         run_output = RunOutput.objects.create(
+            graph=node.graph,
             run=run,
             node=node,
             data_out=data_out
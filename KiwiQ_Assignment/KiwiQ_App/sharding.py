@@ -0,0 +1,190 @@
+from .compute import OutputLookup, evaluate_node
+from django.conf import settings
+from concurrent.futures import FIRST_COMPLETED, wait
+import os
+import threading
+import time
+
+DEFAULT_SHARDING = {
+    'ENABLED': False,
+    'MIN_NODES': 100000,
+    'WORKERS': None,
+}
+
+
+def sharding_options():
+    return {**DEFAULT_SHARDING, **getattr(settings, 'SHARDED_EXECUTION', {})}
+
+def use_sharded_execution(node_count):
+    options = sharding_options()
+    return options['ENABLED'] and node_count >= options['MIN_NODES']
+
+
+def pack(pieces, shards):
+    # Largest first into the lightest bin.
+    bins = [[] for _ in range(shards)]
+    for piece in sorted(pieces, key=len, reverse=True):
+        min(bins, key=len).extend(piece)
+    return [b for b in bins if b]
+
+def split_component(plan, component, shards, target):
+    # Levels wide enough become slices of their own; narrower runs of levels are banded and split into components.
+    levels = {}
+    for i in component:
+        levels.setdefault(plan.levels[i], []).append(i)
+
+    pieces = []
+    band = []
+    position = {}
+    for level in sorted(levels):
+        nodes = levels[level]
+        def barycenter(i):
+            placed = [position[p] for p in plan.parents[i] if p in position]
+            return (sum(placed) / len(placed) if placed else 0.5, i)
+        nodes.sort(key=barycenter)
+        for rank, i in enumerate(nodes):
+            position[i] = rank / len(nodes)
+
+        if len(nodes) >= shards or len(band) + len(nodes) > target:
+            if band:
+                pieces.extend(pack(plan.components(band), shards))
+                band = []
+        if len(nodes) >= shards:
+            size = -(-len(nodes) // shards)
+            pieces.extend(nodes[start:start + size] for start in range(0, len(nodes), size))
+        else:
+            band.extend(nodes)
+    if band:
+        pieces.extend(pack(plan.components(band), shards))
+    return pieces
+
+
+def partition(plan, enabled, shards):
+    # Components are packed whole into the lightest shard; only one larger than its fair share is split.
+    target = max(1, -(-len(enabled) // shards))
+    small = []
+    pieces = []
+    for component in plan.components(enabled):
+        if len(component) <= target:
+            small.append(component)
+        else:
+            pieces.extend(split_component(plan, component, shards, target))
+
+    level_order = lambda i: (plan.levels[i], i)
+    return [sorted(shard, key=level_order) for shard in pieces + pack(small, shards)]
+
+
+def shard_task(plan, shard, root_inputs, data_overwrites):
+    nodes = []
+    sources = {}
+    members = set(shard)
+    for i in shard:
+        node_id = plan.node_ids[i]
+        nodes.append((
+            i,
+            node_id,
+            not plan.parents[i],
+            plan.data_outs[i],
+            plan.gather[i],
+            plan.reducers[i],
+            root_inputs.get(node_id) or {},
+            data_overwrites.get(node_id) or {},
+        ))
+        for src, src_key, _ in plan.gather[i]:
+            if src not in members:
+                sources.setdefault(src, set()).add(src_key)
+    return nodes, sources
+
+def execute_shard(nodes, inputs, names):
+    # Runs in a worker process. ``inputs`` only holds the values crossing cut
+    # edges into this shard, keyed by source index.
+    outputs = dict(inputs)
+    lookup = OutputLookup(outputs)
+    results = []
+    for i, node_id, is_root, data_out, gather, reducers, root_input, overwrite in nodes:
+        started = time.perf_counter()
+        output = evaluate_node(node_id, is_root, data_out, gather, reducers, root_input, overwrite, lookup, names)
+        outputs[i] = output
+        results.append((i, output, (time.perf_counter() - started) * 1000))
+    return results
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool(workers):
+    # Imported here: the process pool machinery is only needed once a run is sharded.
+    from concurrent.futures import ProcessPoolExecutor
+    import multiprocessing
+
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool._max_workers != workers:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def execute_sharded(plan, enabled, run_config):
+    # A shard is submitted once every shard feeding it through a cut edge has finished.
+    workers = sharding_options()['WORKERS'] or os.cpu_count() or 1
+    shards = partition(plan, enabled, workers)
+    shard_of = {i: s for s, shard in enumerate(shards) for i in shard}
+    root_inputs = run_config.root_inputs or {}
+    data_overwrites = run_config.data_overwrites or {}
+
+    tasks = []
+    waiting_on = []
+    for shard in shards:
+        nodes, sources = shard_task(plan, shard, root_inputs, data_overwrites)
+        tasks.append((nodes, sources))
+        waiting_on.append({shard_of[src] for src in sources if src in shard_of})
+    dependants = [[] for _ in shards]
+    for s, upstream in enumerate(waiting_on):
+        for t in upstream:
+            dependants[t].append(s)
+    cut_sources = {src for _, sources in tasks for src in sources}
+    # Shards still to be sent each cut value; it is dropped once all have it.
+    consumers = {}
+    for _, sources in tasks:
+        for src in sources:
+            consumers[src] = consumers.get(src, 0) + 1
+
+    pool = get_pool(workers)
+    cut_values = {}
+    running = {}
+
+    def submit(s):
+        nodes, sources = tasks[s]
+        inputs = {
+            src: {key: cut_values[src].get(key) for key in keys} if src in cut_values else None
+            for src, keys in sources.items()
+        }
+        for src in sources:
+            consumers[src] -= 1
+            if not consumers[src]:
+                cut_values.pop(src, None)
+        names = {src: plan.node_ids[src] for src in sources}
+        names.update((i, node_id) for i, node_id, *_ in nodes)
+        running[pool.submit(execute_shard, nodes, inputs, names)] = s
+
+    for s, upstream in enumerate(waiting_on):
+        if not upstream:
+            submit(s)
+
+    try:
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                s = running.pop(future)
+                for i, output, duration_ms in future.result():
+                    if i in cut_sources:
+                        cut_values[i] = output
+                    yield i, output, duration_ms
+                for d in dependants[s]:
+                    waiting_on[d].discard(s)
+                    if not waiting_on[d]:
+                        submit(d)
+    finally:
+        for future in running:
+            future.cancel()
@@ -0,0 +1,236 @@
+from .models import Graph, NodeStatsBucket, Run, RunOutput
+from .compute import is_number
+from .storage import decode_data_out
+from .writer import write_run
+from django.conf import settings
+from django.db.models import Max, OuterRef, Subquery
+import bisect
+import math
+
+# Each NodeStatsBucket summarises BUCKET_RUNS consecutive outputs of a node in
+# one graph. Per numeric output key it keeps count, sum, sum of squares, min,
+# max and a merging digest (sorted [mean, weight] centroids, t-digest style)
+# for percentiles. A run's outputs are folded into the newest buckets when the
+# run is written, and Graph.stats_run_id records the last run folded, so a
+# query only merges the buckets it spans.
+DEFAULT_NODE_STATS = {
+    'BUCKET_RUNS': 100,
+    'CENTROIDS': 100,
+    'UPDATE_ON_WRITE': True,
+}
+DEFAULT_PERCENTILES = (50, 90, 99)
+FLUSH_BUCKETS = 2000
+LOAD_NODES = 900
+
+
+def stats_options():
+    return {**DEFAULT_NODE_STATS, **getattr(settings, 'NODE_STATS', {})}
+
+
+def new_summary():
+    return {"count": 0, "sum": 0.0, "sum_sq": 0.0, "min": None, "max": None, "centroids": []}
+
+def add_value(summary, value, max_centroids):
+    summary['count'] += 1
+    summary['sum'] += value
+    summary['sum_sq'] += value * value
+    summary['min'] = value if summary['min'] is None else min(summary['min'], value)
+    summary['max'] = value if summary['max'] is None else max(summary['max'], value)
+    bisect.insort(summary['centroids'], [float(value), 1])
+    if len(summary['centroids']) > 2 * max_centroids:
+        summary['centroids'] = compress(summary['centroids'], max_centroids)
+
+def compress(centroids, max_centroids):
+    # Centroids near the median may grow large, those in the tails stay small.
+    total = sum(weight for _, weight in centroids)
+    merged = [list(centroids[0])]
+    before = 0
+    for mean, weight in centroids[1:]:
+        last = merged[-1]
+        q = (before + (last[1] + weight) / 2) / total
+        if last[1] + weight <= max(1, 4 * total * q * (1 - q) / max_centroids):
+            combined = last[1] + weight
+            last[0] += (mean - last[0]) * weight / combined
+            last[1] = combined
+        else:
+            before += last[1]
+            merged.append([mean, weight])
+    return merged
+
+def merge_summaries(summaries, max_centroids):
+    merged = new_summary()
+    centroids = []
+    for summary in summaries:
+        merged['count'] += summary['count']
+        merged['sum'] += summary['sum']
+        merged['sum_sq'] += summary['sum_sq']
+        merged['min'] = summary['min'] if merged['min'] is None else min(merged['min'], summary['min'])
+        merged['max'] = summary['max'] if merged['max'] is None else max(merged['max'], summary['max'])
+        centroids.extend(summary['centroids'])
+    merged['centroids'] = compress(sorted(centroids), max_centroids) if centroids else []
+    return merged
+
+def percentile(summary, p):
+    centroids = summary['centroids']
+    target = p / 100 * summary['count']
+    before = 0
+    for i, (mean, weight) in enumerate(centroids):
+        if before + weight / 2 >= target:
+            if i == 0:
+                return summary['min'] if target <= 0 else mean
+            previous_mean, previous_weight = centroids[i - 1]
+            start = before - previous_weight / 2
+            end = before + weight / 2
+            value = previous_mean + (mean - previous_mean) * (target - start) / (end - start)
+            return min(max(value, summary['min']), summary['max'])
+        before += weight
+    return summary['max']
+
+def describe(summary, percentiles):
+    mean = summary['sum'] / summary['count']
+    variance = max(summary['sum_sq'] / summary['count'] - mean * mean, 0.0)
+    return {
+        "count": summary['count'],
+        "mean": mean,
+        "std": math.sqrt(variance),
+        "min": summary['min'],
+        "max": summary['max'],
+        "percentiles": {f"p{p:g}": percentile(summary, p) for p in percentiles},
+    }
+
+
+class StatsFolder:
+    """Folds run outputs of one graph, in run order, into its nodes' newest buckets.
+
+    Only the buckets of ``node_pks`` are loaded when given, otherwise those of every node.
+    """
+
+    def __init__(self, graph_id, node_pks=None):
+        self.graph_id = graph_id
+        self.options = stats_options()
+        newest = (
+            NodeStatsBucket.objects.filter(graph_id=graph_id, node_id=OuterRef('node_id'))
+            .order_by('-bucket').values('bucket')[:1]
+        )
+        buckets = NodeStatsBucket.objects.filter(graph_id=graph_id, bucket=Subquery(newest))
+        if node_pks is None:
+            self.buckets = {bucket.node_id: bucket for bucket in buckets}
+        else:
+            node_pks = list(node_pks)
+            self.buckets = {}
+            for start in range(0, len(node_pks), LOAD_NODES):
+                self.buckets.update(
+                    (bucket.node_id, bucket) for bucket in buckets.filter(node_id__in=node_pks[start:start + LOAD_NODES])
+                )
+        self.changed = {}
+
+    def add(self, node_pk, run_id, data):
+        bucket = self.buckets.get(node_pk)
+        if bucket is not None and bucket.last_run_id >= run_id:
+            return
+        if bucket is None or bucket.runs >= self.options['BUCKET_RUNS']:
+            if len(self.changed) >= FLUSH_BUCKETS:
+                self.save()
+            bucket = NodeStatsBucket(graph_id=self.graph_id, node_id=node_pk, bucket=bucket.bucket + 1 if bucket else 0)
+            self.buckets[node_pk] = bucket
+        for key, value in (data or {}).items():
+            if is_number(value):
+                add_value(bucket.keys.setdefault(key, new_summary()), value, self.options['CENTROIDS'])
+        bucket.runs += 1
+        bucket.last_run_id = run_id
+        self.changed[id(bucket)] = bucket
+
+    def save(self):
+        created = [bucket for bucket in self.changed.values() if bucket.pk is None]
+        updated = [bucket for bucket in self.changed.values() if bucket.pk is not None]
+        NodeStatsBucket.objects.bulk_create(created)
+        NodeStatsBucket.objects.bulk_update(updated, ['runs', 'last_run_id', 'keys'])
+        self.changed = {}
+
+
+def catch_up_node_stats(graph_id, up_to_run_id=None, chunk_size=2000):
+    """Fold the stored outputs of the graph's runs not folded yet, up to ``up_to_run_id``.
+
+    Only needed for runs written without their stats (UPDATE_ON_WRITE off, or
+    written before stats were kept on write). Runs inside a write transaction.
+    """
+    graph = Graph.objects.select_related('template').get(pk=graph_id)
+    if up_to_run_id is None:
+        up_to_run_id = Run.objects.filter(graph_run_config__graph_id=graph_id).aggregate(last=Max('id'))['last'] or 0
+    folder = StatsFolder(graph_id)
+    outputs = (
+        RunOutput.objects.filter(graph_id=graph_id, run_id__gt=graph.stats_run_id, run_id__lte=up_to_run_id)
+        .order_by('run_id')
+        .values_list('run_id', 'node_id', 'data_out', 'data_blob')
+    )
+    keys = graph.structure.output_keys
+    for run_id, node_pk, data_out, data_blob in outputs.iterator(chunk_size=chunk_size):
+        folder.add(node_pk, run_id, data_out if data_blob is None else decode_data_out(data_blob, keys))
+    folder.save()
+    Graph.objects.filter(pk=graph_id).update(stats_run_id=max(graph.stats_run_id, up_to_run_id))
+
+
+def record_run_stats(graph_id, run_id, outputs):
+    """Fold a run being written, given as (node pk, data_out) pairs, into the stats.
+
+    Called from the run write transaction, before outputs are compacted; a
+    run written in batches calls it once per batch.
+    """
+    if not stats_options()['UPDATE_ON_WRITE']:
+        return
+    stats_run_id = Graph.objects.filter(pk=graph_id).values_list('stats_run_id', flat=True).get()
+    if Run.objects.filter(graph_run_config__graph_id=graph_id, id__gt=stats_run_id, id__lt=run_id).exists():
+        catch_up_node_stats(graph_id, run_id - 1)
+    outputs = list(outputs)
+    folder = StatsFolder(graph_id, [node_pk for node_pk, _ in outputs])
+    for node_pk, data in outputs:
+        folder.add(node_pk, run_id, data)
+    folder.save()
+    Graph.objects.filter(pk=graph_id).update(stats_run_id=run_id)
+
+
+def latest_outputs(graph, node, up_to_run_id, count):
+    """The node's newest ``count`` outputs in runs of ``graph`` up to ``up_to_run_id``."""
+    rows = (
+        RunOutput.objects.filter(graph=graph, node=node, run_id__lte=up_to_run_id)
+        .order_by('-run_id')
+        .values_list('data_out', 'data_blob')[:count]
+    )
+    keys = node.graph.output_keys
+    return [data_out if data_blob is None else decode_data_out(data_blob, keys) for data_out, data_blob in rows]
+
+
+def node_stats(graph, node, last=None, percentiles=DEFAULT_PERCENTILES):
+    """Statistics of the node's numeric output keys over its last ``last`` runs (all when None).
+
+    Whole buckets are merged; when ``last`` ends inside a bucket, the newest
+    outputs of that bucket are read and summarised instead, so at most
+    BUCKET_RUNS - 1 outputs are read.
+    """
+    if Run.objects.filter(graph_run_config__graph=graph, id__gt=graph.stats_run_id).exists():
+        write_run(catch_up_node_stats, graph.id)
+    options = stats_options()
+    runs = 0
+    summaries = {}
+    for bucket in node.stats_buckets.filter(graph=graph).order_by('-bucket').iterator():
+        if last is not None and runs + bucket.runs > last:
+            partial = {}
+            for data in latest_outputs(graph, node, bucket.last_run_id, last - runs):
+                for key, value in (data or {}).items():
+                    if is_number(value):
+                        add_value(partial.setdefault(key, new_summary()), value, options['CENTROIDS'])
+                runs += 1
+            for key, summary in partial.items():
+                summaries.setdefault(key, []).append(summary)
+            break
+        runs += bucket.runs
+        for key, summary in bucket.keys.items():
+            summaries.setdefault(key, []).append(summary)
+    return {
+        "node": node.node_id,
+        "runs": runs,
+        "keys": {
+            key: describe(merge_summaries(parts, options['CENTROIDS']), percentiles)
+            for key, parts in sorted(summaries.items())
+        },
+    }
@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from functools import cache
+import importlib
+import json
+import zlib
+
+# A compact blob starts with two header bytes: the encoding (msgpack or json)
+# and the compression (zstd, zlib or none) of the payload that follows. The
+# payload is a flat [key index, value, key index, value, ...] list, the key
+# indexes pointing into the graph's append-only ``output_keys`` dictionary.
+ENCODING_MSGPACK = b'm'
+ENCODING_JSON = b'j'
+COMPRESSION_ZSTD = b's'
+COMPRESSION_ZLIB = b'z'
+COMPRESSION_NONE = b'n'
+
+
+@cache
+def optional_module(name):
+    # models imports this module, so the optional codecs are only loaded once a blob is encoded or decoded.
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+
+def compact_storage_enabled():
+    return getattr(settings, 'RUN_OUTPUT_STORAGE', {}).get('FORMAT', 'json') == 'compact'
+
+def compression_level():
+    return getattr(settings, 'RUN_OUTPUT_STORAGE', {}).get('COMPRESSION_LEVEL', 6)
+
+
+def encode_data_out(data_out, key_index):
+    pairs = []
+    for key, value in data_out.items():
+        pairs.append(key_index[key])
+        pairs.append(value)
+
+    msgpack = optional_module('msgpack')
+    if msgpack is not None:
+        encoding, payload = ENCODING_MSGPACK, msgpack.packb(pairs)
+    else:
+        encoding, payload = ENCODING_JSON, json.dumps(pairs, separators=(',', ':')).encode()
+
+    zstandard = optional_module('zstandard')
+    if zstandard is not None:
+        compression, compressed = COMPRESSION_ZSTD, zstandard.ZstdCompressor(level=compression_level()).compress(payload)
+    else:
+        compression, compressed = COMPRESSION_ZLIB, zlib.compress(payload, compression_level())
+    if len(compressed) >= len(payload):
+        compression, compressed = COMPRESSION_NONE, payload
+
+    return encoding + compression + compressed
+
+def decode_data_out(blob, keys):
+    blob = bytes(blob)
+    encoding, compression, payload = blob[:1], blob[1:2], blob[2:]
+
+    if compression == COMPRESSION_ZLIB:
+        payload = zlib.decompress(payload)
+    elif compression == COMPRESSION_ZSTD:
+        zstandard = optional_module('zstandard')
+        if zstandard is None:
+            raise ImproperlyConfigured("Run output was stored with zstd compression but 'zstandard' is not installed.")
+        payload = zstandard.ZstdDecompressor().decompress(payload)
+
+    if encoding == ENCODING_MSGPACK:
+        msgpack = optional_module('msgpack')
+        if msgpack is None:
+            raise ImproperlyConfigured("Run output was stored as msgpack but 'msgpack' is not installed.")
+        pairs = msgpack.unpackb(payload)
+    else:
+        pairs = json.loads(payload)
+
+    return {keys[pairs[i]]: pairs[i + 1] for i in range(0, len(pairs), 2)}
+
+
+def compact_run_outputs(graph_id, run_outputs):
+    # Runs inside the run write transaction, which SQLite starts IMMEDIATE, so
+    # concurrent runs cannot hand out the same index to different keys.
+    from .models import Graph
+
+    keys = Graph.objects.filter(pk=graph_id).values_list('output_keys', flat=True).get() or []
+    key_index = {key: i for i, key in enumerate(keys)}
+    added = False
+    for run_output in run_outputs:
+        for key in run_output.data_out:
+            if key not in key_index:
+                key_index[key] = len(keys)
+                keys.append(key)
+                added = True
+    if added:
+        Graph.objects.filter(pk=graph_id).update(output_keys=keys)
+
+    for run_output in run_outputs:
+        run_output.data_blob = encode_data_out(run_output.data_out, key_index)
+        run_output.data_out = None
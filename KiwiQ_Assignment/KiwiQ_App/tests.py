@@ -0,0 +1,519 @@
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import F
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from . import admission, plans
+from .admission import AdmissionController, RunRejected
+from .caching import graph_cache_key, graph_version_key
+from .checkpoints import interrupted_run_ids
+from .compute import REDUCERS, evaluate_node
+from .executor import GraphExecutor, resume_run
+from .models import Edge, Graph, GraphRunConfig, Node, NodeStatsBucket, Run, RunCheckpoint, RunLease, RunOutput
+from .plans import get_plan
+from .retention import compact_run_configs, expired_run_ids, retention_policy
+from .serializers import GraphRunConfigSerializer
+from .sharding import partition
+from datetime import timedelta
+import json
+import threading
+import time
+
+
+# Runs write in the test transaction rather than through the writer thread.
+@override_settings(RUN_WRITER={'ENABLED': False})
+class GraphTestCase(TestCase):
+    def setUp(self):
+        # Rolled back graph ids are reused, so plans and responses cached by id must not survive a test.
+        plans._plans.clear()
+        cache.clear()
+
+
+def graph_data(name, nodes, edges, reducers=None):
+    return {
+        "name": name,
+        "nodes": [
+            {"node_id": node_id, "data_out": data_out, "reducers": (reducers or {}).get(node_id, {})}
+            for node_id, data_out in nodes.items()
+        ],
+        "edges": [
+            {"src_node": src, "dst_node": dst, "src_to_dst_data_keys": keys}
+            for src, dst, keys in edges
+        ],
+    }
+
+def create_graph(client, name, nodes, edges, reducers=None):
+    response = client.post('/api/graphs/', json.dumps(graph_data(name, nodes, edges, reducers)), content_type='application/json')
+    return response.json()['graph_id']
+
+def update_graph(client, graph_id, name, nodes, edges):
+    return client.put(f'/api/graphs/{graph_id}/update/', json.dumps(graph_data(name, nodes, edges)), content_type='application/json')
+
+def create_variant(client, graph_id, name, overrides):
+    data = {"name": name, "overrides": overrides}
+    response = client.post(f'/api/graphs/{graph_id}/variants/', json.dumps(data), content_type='application/json')
+    return response.json()['graph_id']
+
+def run_graph(client, graph_id, root_inputs, **config):
+    response = client.post(
+        f'/api/graphs/{graph_id}/run/', json.dumps({"root_inputs": root_inputs, **config}), content_type='application/json'
+    )
+    return response.json()['run_id']
+
+
+class ReducerTests(SimpleTestCase):
+    # C gathers key "x" from A and B: outputs[0] and outputs[1].
+    outputs = [{"x": 2}, {"x": 5}]
+    names = ["A", "B", "C"]
+    gather = ((0, "x", "v"), (1, "x", "v"))
+
+    def evaluate(self, reducer, data_out, outputs=None):
+        return evaluate_node(
+            "C", False, data_out, self.gather, {"v": REDUCERS[reducer]}, {}, {},
+            outputs or self.outputs, self.names,
+        )
+
+    def test_sum(self):
+        self.assertEqual(self.evaluate('sum', {"v": 10}), {"v": 17})
+
+    def test_max(self):
+        self.assertEqual(self.evaluate('max', {"v": 10}), {"v": 15})
+
+    def test_last(self):
+        self.assertEqual(self.evaluate('last', {"v": 10}), {"v": 15})
+
+    def test_list_replaces_constant(self):
+        self.assertEqual(self.evaluate('list', {"v": 10}), {"v": [2, 5]})
+
+    def test_last_of_strings_replaces_constant(self):
+        self.assertEqual(self.evaluate('last', {"v": "none"}, [{"x": "a"}, {"x": "b"}]), {"v": "b"})
+
+    def test_keys_without_input_keep_constant(self):
+        self.assertEqual(self.evaluate('list', {"v": 1, "w": "c"}), {"v": [2, 5], "w": "c"})
+
+
+class ReducerRunTests(GraphTestCase):
+    def test_list_reducer_output_is_stored(self):
+        graph_id = create_graph(
+            self.client, "Reducers", {"A": {"x": 0}, "B": {"x": 0}, "C": {"l": 0}},
+            [("A", "C", {"x": "l"}), ("B", "C", {"x": "l"})], reducers={"C": {"l": "list"}},
+        )
+        run_id = run_graph(self.client, graph_id, {"A": {"x": 1}, "B": {"x": 2}})
+        output = self.client.get(f'/api/runs/{run_id}/output/C/').json()
+        self.assertEqual(sorted(output['data_out']['l']), [1, 2])
+
+
+class RunCacheTests(GraphTestCase):
+    def setUp(self):
+        super().setUp()
+        self.nodes = {"A": {"x": 0}, "C": {"x": 1}}
+        self.edges = [("A", "C", {"x": "x"})]
+        self.graph_id = create_graph(self.client, "Cached", self.nodes, self.edges)
+        self.run_id = run_graph(self.client, self.graph_id, {"A": {"x": 1}})
+
+    def test_output_not_served_after_graph_update(self):
+        url = f'/api/runs/{self.run_id}/output/C/'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+
+        data = {
+            "name": "Cached",
+            "nodes": [{"node_id": node_id, "data_out": data_out} for node_id, data_out in self.nodes.items()],
+            "edges": [{"src_node": "A", "dst_node": "C", "src_to_dst_data_keys": {"x": "x"}}],
+        }
+        self.client.put(f'/api/graphs/{self.graph_id}/update/', json.dumps(data), content_type='application/json')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code, 400)
+
+    def test_output_not_served_after_run_deleted(self):
+        url = f'/api/runs/{self.run_id}/leaf_outputs/'
+        self.assertEqual(self.client.get(url).status_code, 200)
+        Run.objects.filter(run_id=self.run_id).delete()
+        self.assertEqual(self.client.get(url).status_code, 400)
+
+
+class VariantTests(GraphTestCase):
+    def setUp(self):
+        super().setUp()
+        self.template_id = create_graph(self.client, "Template", {"A": {"x": 0}, "B": {"x": 1}}, [("A", "B", {"x": "x"})])
+        self.variant_id = create_variant(self.client, self.template_id, "Variant", {"B": {"data_out": {"x": 10}}})
+
+    def test_variant_run_uses_overrides(self):
+        run_id = run_graph(self.client, self.variant_id, {"A": {"x": 1}})
+        self.assertEqual(self.client.get(f'/api/runs/{run_id}/output/B/').json()['data_out'], {"x": 11})
+        run_id = run_graph(self.client, self.template_id, {"A": {"x": 1}})
+        self.assertEqual(self.client.get(f'/api/runs/{run_id}/output/B/').json()['data_out'], {"x": 2})
+
+    def test_template_update_changes_variant_revision_and_etag(self):
+        url = f'/api/graphs/{self.variant_id}/'
+        etag = self.client.get(url)['ETag']
+        update_graph(self.client, self.template_id, "Template", {"A": {"x": 0}, "B": {"x": 2}}, [("A", "B", {"x": "x"})])
+        self.assertEqual(Graph.objects.get(id=self.variant_id).revision, 2)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_template_with_variants_cannot_be_deleted(self):
+        response = self.client.delete(f'/api/graphs/{self.template_id}/delete/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['error'], "Graph is the template of other graphs")
+        self.assertTrue(Graph.objects.filter(id=self.template_id).exists())
+
+    def test_variant_of_variant_is_stored_against_template(self):
+        graph_id = create_variant(
+            self.client, self.variant_id, "Variant of variant", {"B": {"data_out": {"y": 5}}, "A": {"data_out": {"x": 3}}}
+        )
+        graph = Graph.objects.get(id=graph_id)
+        self.assertEqual(graph.template_id, self.template_id)
+        self.assertEqual(graph.overrides, {"A": {"data_out": {"x": 3}}, "B": {"data_out": {"x": 10, "y": 5}}})
+
+
+class GraphUpdateTests(GraphTestCase):
+    nodes = {"A": {"x": 0}, "B": {"x": 1}, "C": {"x": 1}}
+    edges = [("A", "B", {"x": "x"}), ("B", "C", {"x": "x"})]
+
+    def setUp(self):
+        super().setUp()
+        self.template_id = create_graph(self.client, "Template", self.nodes, self.edges)
+        self.variant_id = create_variant(self.client, self.template_id, "Variant", {"B": {"data_out": {"x": 10}}})
+        run_graph(self.client, self.variant_id, {"A": {"x": 1}})
+
+    def snapshot(self):
+        return (
+            list(Graph.objects.order_by('id').values_list('id', 'revision', 'template_id', 'overrides')),
+            sorted(Node.objects.values_list('graph_id', 'node_id')),
+            sorted(Edge.objects.values_list('graph_id', 'src_node__node_id', 'dst_node__node_id')),
+            RunOutput.objects.filter(graph_id=self.variant_id).count(),
+        )
+
+    def test_rejected_template_update_leaves_graph_and_variants_unchanged(self):
+        before = self.snapshot()
+        response = update_graph(self.client, self.template_id, "Template", self.nodes, self.edges + [("C", "D", {})])
+        self.assertEqual(response.status_code, 400)
+        response = update_graph(self.client, self.template_id, "Template", self.nodes, self.edges + [("C", "A", {"x": "x"})])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.snapshot(), before)
+        self.assertEqual(self.client.get(f'/api/graphs/{self.variant_id}/toposort/').json()['toposort'], ["A", "B", "C"])
+
+    def cached(self, graph_id, endpoint, *parts):
+        return cache.get(graph_cache_key(graph_id, cache.get(graph_version_key(graph_id)), endpoint, *parts))
+
+    def test_update_bumps_revision_and_invalidates_on_commit(self):
+        self.client.get(f'/api/graphs/{self.template_id}/toposort/')
+        self.assertIsNotNone(self.cached(self.template_id, 'toposort'))
+        with self.captureOnCommitCallbacks() as callbacks:
+            update_graph(self.client, self.template_id, "Template", {**self.nodes, "D": {}}, self.edges + [("C", "D", {})])
+        self.assertIsNotNone(self.cached(self.template_id, 'toposort'))
+        for callback in callbacks:
+            callback()
+        self.assertIsNone(self.cached(self.template_id, 'toposort'))
+        self.assertEqual(Graph.objects.get(id=self.template_id).revision, 2)
+        self.assertEqual(self.client.get(f'/api/graphs/{self.template_id}/toposort/').json()['toposort'], ["A", "B", "C", "D"])
+
+    def test_islands_are_cached_per_config(self):
+        configs = [
+            GraphRunConfigSerializer.deserialize(Graph.objects.get(id=self.template_id), {"disable_list": [node_id]}).id
+            for node_id in ("A", "B")
+        ]
+        for config in configs:
+            self.client.get(f'/api/graphs/{self.template_id}/islands/', {"config": config})
+        islands = [json.loads(self.cached(self.template_id, 'islands', config)[1])['islands'] for config in configs]
+        self.assertEqual(islands, [[["B", "C"]], [["A"], ["C"]]])
+
+    def test_cyclic_graph_is_rejected_by_structural_endpoints(self):
+        # Written behind the API's back, which validates definitions.
+        nodes = {node.node_id: node for node in Node.objects.filter(graph_id=self.template_id)}
+        Edge.objects.create(graph_id=self.template_id, src_node=nodes["C"], dst_node=nodes["A"], src_to_dst_data_keys={})
+        Graph.objects.filter(id=self.template_id).update(revision=F('revision') + 1)
+        for endpoint in ('islands', 'toposort', 'level_traversal'):
+            self.assertEqual(self.client.get(f'/api/graphs/{self.template_id}/{endpoint}/').status_code, 400)
+
+    def test_rejected_variant_update_keeps_it_attached(self):
+        before = self.snapshot()
+        response = update_graph(self.client, self.variant_id, "Variant", self.nodes, self.edges + [("C", "A", {"x": "x"})])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.snapshot(), before)
+
+
+class CompactRunConfigTests(GraphTestCase):
+    def test_recently_used_configs_without_runs_are_kept(self):
+        graph = Graph.objects.get(id=create_graph(self.client, "Configs", {"A": {"x": 0}}, []))
+        # A run in progress: its config exists but its Run row is not written yet.
+        in_flight = GraphRunConfigSerializer.deserialize(graph, {"root_inputs": {"A": {"x": 1}}})
+        stale = GraphRunConfigSerializer.deserialize(graph, {"root_inputs": {"A": {"x": 2}}})
+        GraphRunConfig.objects.filter(id=stale.id).update(last_used_at=timezone.now() - timedelta(hours=2))
+
+        self.assertEqual(compact_run_configs(500, grace_hours=1), 1)
+        self.assertEqual(list(GraphRunConfig.objects.values_list('id', flat=True)), [in_flight.id])
+
+    def test_configs_with_checkpoints_are_kept(self):
+        graph = Graph.objects.get(id=create_graph(self.client, "Configs", {"A": {"x": 0}}, []))
+        interrupted = GraphRunConfigSerializer.deserialize(graph, {"root_inputs": {"A": {"x": 1}}})
+        RunCheckpoint.objects.create(
+            run_id="interrupted", graph_run_config=interrupted, revision=graph.revision, level=0, outputs=[]
+        )
+        GraphRunConfig.objects.filter(id=interrupted.id).update(last_used_at=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(compact_run_configs(500, grace_hours=1), 0)
+        self.assertTrue(RunCheckpoint.objects.filter(run_id="interrupted").exists())
+
+
+@override_settings(RUN_CHECKPOINTS={'ENABLED': False, 'EVERY_NODES': 5, 'EVERY_SECONDS': 60, 'SPILL_NODES': 10})
+class SpillTests(GraphTestCase):
+    def test_large_run_outputs_are_not_all_held(self):
+        nodes = {f"N{i}": {"x": 0} for i in range(30)}
+        edges = [(f"N{i}", f"N{i + 1}", {"x": "x"}) for i in range(29)]
+        graph = Graph.objects.get(id=create_graph(self.client, "Chain", nodes, edges))
+        run_config = GraphRunConfigSerializer.deserialize(graph, {"root_inputs": {"N0": {"x": 1}}})
+        executor = GraphExecutor(graph, run_config)
+        run_id = executor.execute()
+
+        self.assertLessEqual(executor.peak_held_outputs, 6)
+        self.assertEqual(executor.run_outputs, {})
+        self.assertEqual(RunOutput.objects.filter(run__run_id=run_id).count(), 30)
+        self.assertFalse(RunCheckpoint.objects.exists())
+        self.assertEqual(NodeStatsBucket.objects.filter(graph=graph).count(), 30)
+        self.assertEqual(self.client.get(f'/api/runs/{run_id}/output/N29/').json()['data_out'], {"x": 1})
+
+
+class RunLeaseTests(GraphTestCase):
+    def setUp(self):
+        super().setUp()
+        graph = Graph.objects.get(id=create_graph(self.client, "Leases", {"A": {"x": 0}, "C": {"x": 1}}, [("A", "C", {"x": "x"})]))
+        run_config = GraphRunConfigSerializer.deserialize(graph, {"root_inputs": {"A": {"x": 1}}})
+        # A checkpoint written long ago, as by a run stuck in one long level or by one that died.
+        checkpoint = RunCheckpoint.objects.create(
+            run_id="r1", graph_run_config=run_config, revision=graph.revision, level=0,
+            outputs=[[Node.objects.get(graph=graph, node_id="A").pk, {"x": 1}, 0.1]],
+        )
+        RunCheckpoint.objects.filter(id=checkpoint.id).update(created_at=timezone.now() - timedelta(hours=1))
+
+    def test_run_with_live_heartbeat_is_not_interrupted(self):
+        RunLease.objects.create(run_id="r1", owner="live", heartbeat_at=timezone.now())
+        self.assertEqual(interrupted_run_ids(), [])
+        with self.assertRaises(ValidationError):
+            resume_run("r1")
+        self.assertTrue(RunCheckpoint.objects.filter(run_id="r1").exists())
+
+    def test_run_with_stale_heartbeat_is_resumed(self):
+        RunLease.objects.create(run_id="r1", owner="dead", heartbeat_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(interrupted_run_ids(), ["r1"])
+        self.assertEqual(resume_run("r1"), "r1")
+        self.assertEqual(self.client.get('/api/runs/r1/output/C/').json()['data_out'], {"x": 2})
+        self.assertFalse(RunCheckpoint.objects.exists() or RunLease.objects.exists())
+
+
+class AdmissionTests(SimpleTestCase):
+    def wait_queued(self, controller, count):
+        while len(controller.queue) < count:
+            time.sleep(0.001)
+
+    def queue_run(self, controller, admitted, name):
+        queued = len(controller.queue) + 1
+        thread = threading.Thread(target=lambda: admitted.append((name, controller.acquire(1))))
+        thread.start()
+        self.wait_queued(controller, queued)
+        return thread
+
+    def test_waiting_runs_are_admitted_in_order(self):
+        controller = AdmissionController(max_runs=1, max_nodes=100, max_queued=2, timeout=5)
+        controller.acquire(1)
+        admitted = []
+        first = self.queue_run(controller, admitted, "first")
+        second = self.queue_run(controller, admitted, "second")
+
+        controller.release(1)
+        first.join(1)
+        self.assertEqual(admitted, [("first", 1)])
+        controller.release(1)
+        second.join(1)
+        self.assertEqual(admitted, [("first", 1), ("second", 1)])
+
+    def test_full_queue_rejects(self):
+        controller = AdmissionController(max_runs=1, max_nodes=100, max_queued=1, timeout=5)
+        controller.acquire(1)
+        waiting = self.queue_run(controller, [], "waiting")
+        with self.assertRaisesMessage(RunRejected, "Too many runs waiting"):
+            controller.acquire(1)
+        controller.release(1)
+        waiting.join(1)
+
+    def test_wait_times_out(self):
+        controller = AdmissionController(max_runs=1, max_nodes=100, max_queued=1, timeout=0.05)
+        controller.acquire(1)
+        with self.assertRaisesMessage(RunRejected, "Timed out"):
+            controller.acquire(1)
+        self.assertEqual(len(controller.queue), 0)
+
+    def test_run_over_node_cap_is_admitted_alone(self):
+        controller = AdmissionController(max_runs=4, max_nodes=10, max_queued=1, timeout=0.05)
+        self.assertEqual(controller.acquire(50), 10)
+        with self.assertRaises(RunRejected):
+            controller.acquire(1)
+        controller.release(10)
+        self.assertEqual(controller.acquire(1), 1)
+
+
+@override_settings(RUN_ADMISSION={'ENABLED': True, 'MAX_RUNS': 1, 'MAX_NODES': 100, 'MAX_QUEUED': 0, 'QUEUE_TIMEOUT': 1, 'RETRY_AFTER': 7})
+class RunRejectedTests(GraphTestCase):
+    def setUp(self):
+        super().setUp()
+        admission._controller = None
+        self.addCleanup(setattr, admission, '_controller', None)
+
+    def test_busy_server_answers_429(self):
+        graph_id = create_graph(self.client, "Busy", {"A": {"x": 0}}, [])
+        admission.get_admission_controller().acquire(1)
+        response = self.client.post(f'/api/graphs/{graph_id}/run/', json.dumps({"root_inputs": {}}), content_type='application/json')
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], "7")
+
+
+class RunEventsTests(GraphTestCase):
+    def test_run_executing_in_another_worker_is_409(self):
+        RunLease.objects.create(run_id="elsewhere", owner="other", heartbeat_at=timezone.now())
+        self.assertEqual(self.client.get('/api/runs/elsewhere/events/').status_code, 409)
+        RunLease.objects.filter(run_id="elsewhere").update(heartbeat_at=timezone.now() - timedelta(minutes=5))
+        self.assertEqual(self.client.get('/api/runs/elsewhere/events/').status_code, 400)
+
+    def test_lease_is_released_with_the_run(self):
+        graph = Graph.objects.get(id=create_graph(self.client, "Events", {"A": {"x": 0}}, []))
+        executor = GraphExecutor(graph, GraphRunConfigSerializer.deserialize(graph, {"root_inputs": {"A": {"x": 1}}}))
+        executor.claim()
+        self.assertTrue(RunLease.objects.filter(run_id=executor.run.run_id).exists())
+        executor.execute()
+        self.assertFalse(RunLease.objects.exists())
+        self.assertEqual(self.client.get(f'/api/runs/{executor.run.run_id}/events/').status_code, 200)
+
+
+class PartitionTests(GraphTestCase):
+    def test_connected_graph_shards_run_side_by_side(self):
+        nodes = {f"n{i}_{j}": {"x": 1} for i in range(8) for j in range(6)}
+        edges = [(f"n{i}_{j}", f"n{i + 1}_{j}", {"x": "x"}) for i in range(7) for j in range(6)]
+        edges += [(f"n{i}_{j}", f"n{i}_{j + 1}", {"x": "x"}) for i in range(8) for j in range(5)]
+        plan = get_plan(Graph.objects.get(id=create_graph(self.client, "Lattice", nodes, edges)))
+        shards = partition(plan, plan.level_order, 4)
+
+        self.assertEqual(sorted(i for shard in shards for i in shard), list(range(len(plan))))
+        shard_of = {i: s for s, shard in enumerate(shards) for i in shard}
+        upstream = [{shard_of[p] for i in shard for p in plan.parents[i]} - {s} for s, shard in enumerate(shards)]
+        # Longest chain of dependent shards, counted in nodes; a strict chain of bands would cover all 48.
+        longest = {}
+        for s in sorted(range(len(shards)), key=lambda s: plan.levels[shards[s][0]]):
+            longest[s] = len(shards[s]) + max((longest[t] for t in upstream[s]), default=0)
+        self.assertLess(max(longest.values()), len(plan) // 2 + 1)
+
+
+class QueryPlanTests(TestCase):
+    """The lookups on the run and graph paths are index searches, not table scans."""
+
+    def assertSearches(self, queryset, table, columns):
+        lines = [line for line in queryset.explain().splitlines() if f"KiwiQ_App_{table} " in line + " "]
+        self.assertTrue(lines, f"{table} not in query plan")
+        for line in lines:
+            self.assertIn("SEARCH", line)
+            self.assertRegex(line, r"USING (COVERING )?INDEX|USING INTEGER PRIMARY KEY")
+            for column in columns:
+                self.assertIn(f"{column}=?", line)
+
+    def test_edges_by_graph(self):
+        self.assertSearches(Edge.objects.filter(graph_id=1), 'edge', ['graph_id'])
+
+    def test_run_by_run_id(self):
+        self.assertSearches(Run.objects.filter(run_id="run"), 'run', ['run_id'])
+
+    def test_run_output_by_run_and_node(self):
+        self.assertSearches(RunOutput.objects.filter(run_id=1, node_id=1), 'runoutput', ['run_id', 'node_id'])
+
+    def test_run_outputs_by_graph_and_node(self):
+        queryset = RunOutput.objects.filter(graph_id=1, node_id=1, run_id__gt=0).order_by('run_id')
+        self.assertSearches(queryset, 'runoutput', ['graph_id', 'node_id'])
+
+    def test_node_by_graph_and_node_id(self):
+        self.assertSearches(Node.objects.filter(graph_id=1, node_id="A"), 'node', ['graph_id', 'node_id'])
+
+    def test_leaf_outputs(self):
+        queryset = RunOutput.objects.filter(run__run_id="run", node__is_leaf=True)
+        self.assertSearches(queryset, 'run', ['run_id'])
+        self.assertSearches(queryset, 'runoutput', ['run_id'])
+        self.assertSearches(queryset, 'node', ['rowid'])
+
+
+class RunDiffTests(GraphTestCase):
+    def test_partial_run_of_same_config_is_not_identical(self):
+        graph_id = create_graph(
+            self.client, "Diff", {"A": {"x": 0}, "B": {"x": 1}, "C": {"x": 2}},
+            [("A", "B", {"x": "x"}), ("A", "C", {"x": "x"})],
+        )
+        response = self.client.post(
+            f'/api/graphs/{graph_id}/run/', json.dumps({"root_inputs": {"A": {"x": 1}}}), content_type='application/json'
+        ).json()
+        partial = self.client.post(f"/api/graphs/{graph_id}/evaluate/B/?config={response['graph_run_config']}").json()
+
+        diff = self.client.get(f"/api/runs/{response['run_id']}/diff/{partial['run_id']}/").json()
+        self.assertEqual(diff['dirty_nodes'], 1)
+        self.assertEqual(diff['changes'], [{"node": "C", "key": "x", "a": 3, "b": None, "delta": None}])
+
+
+class PartialRunTests(GraphTestCase):
+    def setUp(self):
+        super().setUp()
+        self.graph_id = create_graph(
+            self.client, "Partial", {"A": {"x": 0}, "B": {"x": 1}, "C": {"x": 2}},
+            [("A", "B", {"x": "x"}), ("A", "C", {"x": "x"})],
+        )
+        config = GraphRunConfigSerializer.deserialize(Graph.objects.get(id=self.graph_id), {"root_inputs": {"A": {"x": 1}}})
+        self.url = f'/api/graphs/{self.graph_id}/evaluate/B/?config={config.id}'
+
+    def test_get_writes_nothing(self):
+        response = self.client.get(self.url + '&persist=1').json()
+        self.assertEqual(response['data_out'], {"x": 2})
+        self.assertFalse(Run.objects.exists())
+
+    def test_persisted_evaluation_is_a_partial_run(self):
+        run_id = self.client.post(self.url).json()['run_id']
+        self.assertTrue(Run.objects.get(run_id=run_id).partial)
+        events = b"".join(self.client.get(f'/api/runs/{run_id}/events/').streaming_content).decode()
+        self.assertIn('"status": "partial"', events)
+        self.assertEqual(self.client.get(f'/api/runs/{run_id}/leaf_outputs/').status_code, 400)
+
+    def test_partial_runs_do_not_count_toward_keep_last(self):
+        complete = [run_graph(self.client, self.graph_id, {"A": {"x": x}}) for x in (1, 2)]
+        self.client.post(self.url)
+        run_graph(self.client, self.graph_id, {"A": {"x": 3}})
+        self.assertEqual(expired_run_ids(retention_policy(KEEP_LAST=2)), [Run.objects.get(run_id=complete[0]).id])
+        self.assertEqual(len(expired_run_ids(retention_policy(KEEP_LAST=1))), 3)
+
+
+@override_settings(NODE_STATS={'BUCKET_RUNS': 5, 'CENTROIDS': 100, 'UPDATE_ON_WRITE': True})
+class NodeStatsTests(GraphTestCase):
+    def setUp(self):
+        super().setUp()
+        self.graph_id = create_graph(self.client, "Stats", {"A": {"x": 0}}, [])
+        for x in range(1, 8):
+            run_graph(self.client, self.graph_id, {"A": {"x": x}})
+        self.url = f'/api/graphs/{self.graph_id}/nodes/A/stats/'
+
+    def test_buckets_are_updated_when_runs_are_written(self):
+        self.assertEqual(sorted(NodeStatsBucket.objects.values_list('bucket', 'runs')), [(0, 5), (1, 2)])
+        self.assertEqual(Graph.objects.get(id=self.graph_id).stats_run_id, Run.objects.latest('id').id)
+
+    def test_last_runs_are_exact(self):
+        stats = self.client.get(self.url, {"last": 3}).json()
+        self.assertEqual(stats['runs'], 3)
+        self.assertEqual(stats['keys']['x']['mean'], 6.0)
+        self.assertEqual(stats['keys']['x']['min'], 5)
+
+    def test_all_runs(self):
+        stats = self.client.get(self.url).json()
+        self.assertEqual(stats['runs'], 7)
+        self.assertEqual(stats['keys']['x']['mean'], 4.0)
+
+    def test_runs_written_without_stats_are_folded_on_read(self):
+        with self.settings(NODE_STATS={'BUCKET_RUNS': 5, 'CENTROIDS': 100, 'UPDATE_ON_WRITE': False}):
+            run_graph(self.client, self.graph_id, {"A": {"x": 8}})
+        stats = self.client.get(self.url, {"last": 2}).json()
+        self.assertEqual((stats['runs'], stats['keys']['x']['mean']), (2, 7.5))
+        # The next run written picks up from the folded watermark.
+        run_graph(self.client, self.graph_id, {"A": {"x": 9}})
+        self.assertEqual(self.client.get(self.url).json()['keys']['x']['count'], 9)
@@ -3,12 +3,22 @@ from . import views
 
 urlpatterns = [
     path('graphs/', views.create_graph, name='create_graph'),
+    path('graphs/import/', views.import_graph, name='import_graph'),
     path('graphs/<int:graph_id>/', views.get_graph, name='get_graph'),
+    path('graphs/<int:graph_id>/export/', views.export_graph, name='export_graph'),
+    path('graphs/<int:graph_id>/variants/', views.create_variant, name='create_variant'),
     path('graphs/<int:graph_id>/update/', views.update_graph, name='update_graph'),
     path('graphs/<int:graph_id>/delete/', views.delete_graph, name='delete_graph'),
     path('graphs/<int:graph_id>/run/', views.run_graph, name='run_graph'),
+    path('graphs/<int:graph_id>/plan/', views.plan_graph, name='plan_graph'),
+    path('graphs/<int:graph_id>/evaluate/<str:node_id>/', views.evaluate_graph_node, name='evaluate_graph_node'),
+    path('graphs/<int:graph_id>/nodes/<str:node_id>/stats/', views.get_node_stats, name='get_node_stats'),
     path('runs/<str:run_id>/output/<str:node_id>/', views.get_run_output, name='get_run_output'),
     path('runs/<str:run_id>/leaf_outputs/', views.get_leaf_outputs, name='get_leaf_outputs'),
+    path('runs/<str:run_id>/events/', views.get_run_events, name='get_run_events'),
+    path('runs/<str:run_id>/diff/<str:other_run_id>/', views.diff_runs, name='diff_runs'),
+    path('runs/<str:run_id>/resume/', views.resume_graph_run, name='resume_graph_run'),
+    path('runs/<str:run_id>/replay/', views.replay_graph_run, name='replay_graph_run'),
     path('graphs/<int:graph_id>/islands/', views.get_islands, name='get_islands'),
     path('graphs/<int:graph_id>/toposort/', views.get_toposort, name='get_toposort'),
     path('graphs/<int:graph_id>/level_traversal/', views.get_level_traversal, name='get_level_traversal'),
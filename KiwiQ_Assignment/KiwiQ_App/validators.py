@@ -4,22 +4,25 @@ from collections import defaultdict, deque
 
 class GraphValidator:
     def validate_graph(graph):
-        try:
-            GraphValidator.topological_sort(graph)
-        except ValidationError as e:
-            raise e
+        node_ids = list(graph.graph_nodes.values_list('node_id', flat=True))
+        edges = list(Edge.objects.filter(graph=graph).values_list('src_node__node_id', 'dst_node__node_id'))
+        GraphValidator.validate_definition(node_ids, edges)
 
-        if not GraphValidator.is_connected(graph):
+    def validate_definition(node_ids, edges):
+        # ``edges`` are (src node_id, dst node_id) pairs, so a definition can be checked before it is saved.
+        GraphValidator.topological_sort(node_ids, edges)
+
+        if not GraphValidator.is_connected(node_ids, edges):
             raise ValidationError("Graph contains multiple disconnected components (islands).")
 
-    def topological_sort(graph):
+    def topological_sort(node_ids, edges):
         in_degree = defaultdict(int)
         adj_list = defaultdict(list)
-        for edge in Edge.objects.filter(src_node__graph=graph):
-            adj_list[edge.src_node.node_id].append(edge.dst_node.node_id)
-            in_degree[edge.dst_node.node_id] += 1
+        for src_node_id, dst_node_id in edges:
+            adj_list[src_node_id].append(dst_node_id)
+            in_degree[dst_node_id] += 1
 
-        queue = deque([node.node_id for node in graph.graph_nodes.all() if in_degree[node.node_id] == 0])
+        queue = deque([node_id for node_id in node_ids if in_degree[node_id] == 0])
         sorted_order = []
 
         while queue:
@@ -30,24 +33,22 @@ class GraphValidator:
                 if in_degree[neighbor] == 0:
                     queue.append(neighbor)
 
-        if len(sorted_order) != graph.graph_nodes.count():
+        if len(sorted_order) != len(node_ids):
             raise ValidationError("Graph contains a cycle.")
 
-    def is_connected(graph):
-        
-        nodes = list(graph.graph_nodes.all())
-        if not nodes:
-            return True 
+    def is_connected(node_ids, edges):
+        if not node_ids:
+            return True
 
         visited = set()
         queue = deque()
-        queue.append(nodes[0].node_id)
-        visited.add(nodes[0].node_id)
+        queue.append(node_ids[0])
+        visited.add(node_ids[0])
 
         adj_list = defaultdict(list)
-        for edge in Edge.objects.filter(src_node__graph=graph):
-            adj_list[edge.src_node.node_id].append(edge.dst_node.node_id)
-            adj_list[edge.dst_node.node_id].append(edge.src_node.node_id)
+        for src_node_id, dst_node_id in edges:
+            adj_list[src_node_id].append(dst_node_id)
+            adj_list[dst_node_id].append(src_node_id)
 
         while queue:
             current = queue.popleft()
@@ -56,4 +57,4 @@ class GraphValidator:
                     visited.add(neighbor)
                     queue.append(neighbor)
 
-        return len(visited) == graph.graph_nodes.count()
+        return len(visited) == len(node_ids)
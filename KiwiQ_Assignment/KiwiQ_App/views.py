@@ -1,11 +1,27 @@
-from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed
-from .serializers import GraphSerializer, GraphRunConfigSerializer, RunOutputSerializer
-from .models import Graph, Node, Edge, GraphRunConfig, Run, RunOutput
+from django.http import JsonResponse, HttpResponse, HttpResponseBadRequest, HttpResponseNotAllowed, StreamingHttpResponse
+from .serializers import GraphSerializer, GraphRunConfigSerializer, RunOutputSerializer, async_list
+from .models import Graph, Node, GraphRunConfig, Run, RunOutput, RunCheckpoint, generate_config_hash
 from django.core.exceptions import ValidationError
-from .executor import GraphExecutor
+from django.db.models import ProtectedError
 from .validators import GraphValidator
+from .plans import get_plan
+from .caching import cached_graph_response, cached_run_response, invalidate_graph
+from .graph_io import import_ndjson, export_ndjson, dump_line
+from .diffing import RunDiff
+from .stats import node_stats, DEFAULT_PERCENTILES
+from .planner import node_timings, plan_execution
+from .events import RunChannel, get_channel
+from .admission import RunRejected, admission_options
+from django.core.handlers.asgi import ASGIRequest
+from asgiref.sync import sync_to_async
+import asyncio
 import json
 
+def run_rejected(error):
+    response = HttpResponse(json.dumps({"error": str(error)}), content_type="application/json", status=429)
+    response['Retry-After'] = str(admission_options()['RETRY_AFTER'])
+    return response
+
 def create_graph(request):
     if request.method != 'POST':
         return HttpResponseNotAllowed(['POST'])
@@ -16,13 +32,31 @@ def create_graph(request):
     except (ValidationError, KeyError) as e:
         return HttpResponseBadRequest(json.dumps({"error": str(e)}), content_type="application/json")
 
-def get_graph(request, graph_id):
+def import_graph(request):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        # Iterating the request reads the NDJSON body line by line instead of loading it whole.
+        graph = import_ndjson(request)
+        return JsonResponse({"message": "Graph imported successfully", "graph_id": graph.id}, status=201)
+    except (ValidationError, KeyError) as e:
+        return HttpResponseBadRequest(json.dumps({"error": str(e)}), content_type="application/json")
+
+def export_graph(request, graph_id):
     if request.method != 'GET':
         return HttpResponseNotAllowed(['GET'])
     try:
         graph = Graph.objects.get(id=graph_id)
-        serialized_graph = GraphSerializer.serialize(graph)
-        return JsonResponse(serialized_graph, status=200)
+        return StreamingHttpResponse(export_ndjson(graph), content_type="application/x-ndjson")
+    except Graph.DoesNotExist:
+        return HttpResponseBadRequest(json.dumps({"error": "Graph not found"}), content_type="application/json")
+
+async def get_graph(request, graph_id):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        graph = await Graph.objects.aget(id=graph_id)
+        return await cached_graph_response(request, graph, 'graph', lambda: GraphSerializer.aserialize(graph))
     except Graph.DoesNotExist:
         return HttpResponseBadRequest(json.dumps({"error": "Graph not found"}), content_type="application/json")
 
@@ -32,9 +66,7 @@ def update_graph(request, graph_id):
     try:
         graph = Graph.objects.get(id=graph_id)
         data = json.loads(request.body)
-        graph.graph_nodes.all().delete()
-        Edge.objects.filter(src_node__graph=graph).delete()
-        graph = GraphSerializer.deserialize(data)
+        GraphSerializer.deserialize(data, graph=graph)
         return JsonResponse({"message": "Graph updated successfully"}, status=200)
     except Graph.DoesNotExist:
         return HttpResponseBadRequest(json.dumps({"error": "Graph not found"}), content_type="application/json")
@@ -47,9 +79,24 @@ def delete_graph(request, graph_id):
     try:
         graph = Graph.objects.get(id=graph_id)
         graph.delete()
+        invalidate_graph(graph_id)
         return JsonResponse({"message": "Graph deleted successfully"}, status=200)
     except Graph.DoesNotExist:
         return HttpResponseBadRequest(json.dumps({"error": "Graph not found"}), content_type="application/json")
+    except ProtectedError:
+        return HttpResponseBadRequest(json.dumps({"error": "Graph is the template of other graphs"}), content_type="application/json")
+
+def create_variant(request, graph_id):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        base = Graph.objects.get(id=graph_id)
+        graph = GraphSerializer.deserialize_variant(base, json.loads(request.body))
+        return JsonResponse({"message": "Graph created successfully", "graph_id": graph.id}, status=201)
+    except Graph.DoesNotExist:
+        return HttpResponseBadRequest(json.dumps({"error": "Graph not found"}), content_type="application/json")
+    except (ValidationError, KeyError) as e:
+        return HttpResponseBadRequest(json.dumps({"error": str(e)}), content_type="application/json")
 
 def run_graph(request, graph_id):
     if request.method != 'POST':
@@ -58,24 +105,185 @@ def run_graph(request, graph_id):
         graph = Graph.objects.get(id=graph_id)
         data = json.loads(request.body)
         run_config = GraphRunConfigSerializer.deserialize(graph, data)
-        GraphValidator.validate_graph(graph)
+        GraphValidator.validate_graph(graph.structure)
+        # The run path (executor, sharding, writer, checkpoints) is imported on
+        # first use, or ahead of it by the startup warmup.
+        from .executor import GraphExecutor
         executor = GraphExecutor(graph, run_config)
+        if request.GET.get('stream'):
+            # Executes in the background; follow progress at /runs/<run_id>/events/.
+            executor.execute_streaming()
+            return JsonResponse({"run_id": executor.run.run_id, "graph_run_config": run_config.id}, status=202)
         run_id = executor.execute()
-        return JsonResponse({"run_id": run_id}, status=201)
+        return JsonResponse({"run_id": run_id, "graph_run_config": run_config.id}, status=201)
+    except RunRejected as e:
+        return run_rejected(e)
+    except Graph.DoesNotExist:
+        return HttpResponseBadRequest(json.dumps({"error": "Graph not found"}), content_type="application/json")
+    except (ValidationError, KeyError) as e:
+        return HttpResponseBadRequest(json.dumps({"error": str(e)}), content_type="application/json")
+
+def resume_graph_run(request, run_id):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    from .executor import resume_run
+    try:
+        return JsonResponse({"run_id": resume_run(run_id)}, status=201)
+    except RunCheckpoint.DoesNotExist:
+        return HttpResponseBadRequest(json.dumps({"error": "No checkpoint found for the run"}), content_type="application/json")
+    except RunRejected as e:
+        return run_rejected(e)
+    except ValidationError as e:
+        return HttpResponseBadRequest(json.dumps({"error": str(e)}), content_type="application/json")
+
+def replay_graph_run(request, run_id):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    from .executor import replay_run
+    try:
+        run = Run.objects.select_related('graph_run_config__graph').get(run_id=run_id)
+        replay_id, mismatched = replay_run(run)
+        return JsonResponse({
+            "run_id": replay_id,
+            "replay_of": run_id,
+            "identical": not mismatched,
+            "mismatched_nodes": mismatched,
+        }, status=201)
+    except Run.DoesNotExist:
+        return HttpResponseBadRequest(json.dumps({"error": "Run not found"}), content_type="application/json")
+    except RunRejected as e:
+        return run_rejected(e)
+    except ValidationError as e:
+        return HttpResponseBadRequest(json.dumps({"error": str(e)}), content_type="application/json")
+
+def plan_graph(request, graph_id):
+    if request.method != 'POST':
+        return HttpResponseNotAllowed(['POST'])
+    try:
+        graph = Graph.objects.get(id=graph_id)
+        config = GraphRunConfigSerializer.parse(json.loads(request.body))
+        execution_plan = plan_execution(get_plan(graph), config, node_timings(graph))
+        return JsonResponse(execution_plan, status=200)
     except Graph.DoesNotExist:
         return HttpResponseBadRequest(json.dumps({"error": "Graph not found"}), content_type="application/json")
     except (ValidationError, KeyError) as e:
         return HttpResponseBadRequest(json.dumps({"error": str(e)}), content_type="application/json")
 
-def get_run_output(request, run_id, node_id):
+def evaluate_graph_node(request, graph_id, node_id):
+    if request.method not in ('GET', 'POST'):
+        return HttpResponseNotAllowed(['GET', 'POST'])
+    try:
+        graph = Graph.objects.get(id=graph_id)
+        run_config = None
+        if 'config' in request.GET:
+            run_config = graph.run_configs.get(id=request.GET['config'])
+            config = {
+                "root_inputs": run_config.root_inputs,
+                "data_overwrites": run_config.data_overwrites,
+                "enable_list": run_config.enable_list,
+                "disable_list": run_config.disable_list,
+            }
+            config_hash = run_config.config_hash
+        else:
+            config = GraphRunConfigSerializer.parse({})
+            config_hash = generate_config_hash(**config)
+
+        plan = get_plan(graph)
+        if node_id not in plan.index:
+            return HttpResponseBadRequest(json.dumps({"error": "Node not found"}), content_type="application/json")
+        data_out, computed = plan.evaluate_lazy(node_id, config_hash, config)
+        response = {"node": node_id, "data_out": data_out, "evaluated_nodes": computed}
+
+        # GET writes nothing, the memoized values stay in the process; POST saves them as a partial run.
+        if request.method == 'POST':
+            from .executor import persist_evaluation
+            if run_config is None:
+                run_config = GraphRunConfigSerializer.deserialize(graph, config)
+            memo = plan.evaluation(config_hash, config)
+            cone = plan.ancestor_cone(plan.index[node_id], memo['enabled'])
+            response["run_id"] = persist_evaluation(graph, run_config, plan, [(i, memo['outputs'][i]) for i in cone])
+            response["graph_run_config"] = run_config.id
+        return JsonResponse(response, status=200)
+    except Graph.DoesNotExist:
+        return HttpResponseBadRequest(json.dumps({"error": "Graph not found"}), content_type="application/json")
+    except (GraphRunConfig.DoesNotExist, ValueError):
+        return HttpResponseBadRequest(json.dumps({"error": "Run configuration not found for the graph"}), content_type="application/json")
+    except (ValidationError, KeyError) as e:
+        return HttpResponseBadRequest(json.dumps({"error": str(e)}), content_type="application/json")
+
+def get_node_stats(request, graph_id, node_id):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        last = int(request.GET['last']) if 'last' in request.GET else None
+        percentiles = DEFAULT_PERCENTILES
+        if 'percentiles' in request.GET:
+            percentiles = [float(p) for p in request.GET['percentiles'].split(',')]
+        if any(not 0 <= p <= 100 for p in percentiles) or (last is not None and last < 1):
+            raise ValueError
+    except ValueError:
+        return HttpResponseBadRequest(json.dumps({"error": "last must be a positive integer and percentiles numbers between 0 and 100"}), content_type="application/json")
+    try:
+        graph = Graph.objects.get(id=graph_id)
+        node = Node.objects.select_related('graph').get(graph_id=graph.structure_id, node_id=node_id)
+        return JsonResponse(node_stats(graph, node, last, percentiles), status=200)
+    except Graph.DoesNotExist:
+        return HttpResponseBadRequest(json.dumps({"error": "Graph not found"}), content_type="application/json")
+    except Node.DoesNotExist:
+        return HttpResponseBadRequest(json.dumps({"error": "Node not found"}), content_type="application/json")
+
+def diff_runs(request, run_id, other_run_id):
     if request.method != 'GET':
         return HttpResponseNotAllowed(['GET'])
     try:
-        run = Run.objects.get(run_id=run_id)
-        node = Node.objects.get(node_id=node_id, graph=run.graph_run_config.graph)
-        run_output = RunOutput.objects.get(run=run, node=node)
-        serialized_output = RunOutputSerializer.serialize(run_output)
-        return JsonResponse(serialized_output, status=200)
+        tolerance = float(request.GET.get('tolerance', 0))
+        top = int(request.GET['top']) if 'top' in request.GET else None
+    except ValueError:
+        return HttpResponseBadRequest(json.dumps({"error": "tolerance must be a number and top an integer"}), content_type="application/json")
+    try:
+        runs = Run.objects.select_related('graph_run_config__graph').in_bulk([run_id, other_run_id], field_name='run_id')
+        if run_id not in runs or other_run_id not in runs:
+            raise Run.DoesNotExist
+        diff = RunDiff(runs[run_id], runs[other_run_id], tolerance)
+        changes = diff.changes() if top is None else diff.top_changes(top)
+
+        if request.GET.get('stream'):
+            # One change per line, written while the outputs are still being read.
+            return StreamingHttpResponse((dump_line(change) for change in changes), content_type="application/x-ndjson")
+        changes = list(changes)
+        return JsonResponse({
+            "run_a": run_id,
+            "run_b": other_run_id,
+            "tolerance": tolerance,
+            "dirty_nodes": len(diff.dirty),
+            "compared_nodes": diff.compared_nodes,
+            "changes": changes,
+        }, status=200)
+    except Run.DoesNotExist:
+        return HttpResponseBadRequest(json.dumps({"error": "Run not found"}), content_type="application/json")
+    except ValidationError as e:
+        return HttpResponseBadRequest(json.dumps({"error": str(e)}), content_type="application/json")
+
+async def get_run_output(request, run_id, node_id):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    async def render():
+        run, run_output = await asyncio.gather(
+            Run.objects.select_related('graph_run_config__graph').aget(run_id=run_id),
+            RunOutput.objects.select_related('run', 'node__graph').aget(run__run_id=run_id, node__node_id=node_id),
+            return_exceptions=True,
+        )
+        if isinstance(run, Exception):
+            raise run
+        if isinstance(run_output, RunOutput.DoesNotExist):
+            if not await Node.objects.filter(node_id=node_id, graph_id=run.graph_run_config.graph.structure_id).aexists():
+                raise Node.DoesNotExist
+        if isinstance(run_output, Exception):
+            raise run_output
+        return RunOutputSerializer.serialize(run_output)
+
+    try:
+        return await cached_run_response(request, run_id, f"output:{node_id}", render)
     except Run.DoesNotExist:
         return HttpResponseBadRequest(json.dumps({"error": "Run not found"}), content_type="application/json")
     except Node.DoesNotExist:
@@ -83,88 +291,122 @@ def get_run_output(request, run_id, node_id):
     except RunOutput.DoesNotExist:
         return HttpResponseBadRequest(json.dumps({"error": "Run output not found for the node"}), content_type="application/json")
 
-def get_leaf_outputs(request, run_id):
+async def get_leaf_outputs(request, run_id):
     if request.method != 'GET':
         return HttpResponseNotAllowed(['GET'])
+    async def render():
+        # Leaf nodes have no outgoing edges; the flag is kept on the node.
+        partial, outputs = await asyncio.gather(
+            Run.objects.filter(run_id=run_id).values_list('partial', flat=True).afirst(),
+            async_list(
+                RunOutput.objects.filter(run__run_id=run_id, node__is_leaf=True).select_related('run', 'node__graph')
+            ),
+        )
+        if partial is None:
+            raise Run.DoesNotExist
+        if partial:
+            raise ValidationError("The run is a partial evaluation; it has no leaf outputs.")
+        return {"leaf_outputs": [RunOutputSerializer.serialize(output) for output in outputs]}
+
     try:
-        run = Run.objects.get(run_id=run_id)
-        graph = run.graph_run_config.graph
-        # Leaf nodes have no outgoing edges
-        leaf_nodes = graph.graph_nodes.filter(out_edges__isnull=True)
-        outputs = RunOutput.objects.filter(run=run, node__in=leaf_nodes)
-        serialized_outputs = [RunOutputSerializer.serialize(output) for output in outputs]
-        return JsonResponse({"leaf_outputs": serialized_outputs}, status=200)
+        return await cached_run_response(request, run_id, 'leaf_outputs', render)
     except Run.DoesNotExist:
         return HttpResponseBadRequest(json.dumps({"error": "Run not found"}), content_type="application/json")
+    except ValidationError as e:
+        return HttpResponseBadRequest(json.dumps({"error": str(e)}), content_type="application/json")
 
-def get_islands(request, graph_id):
+async def get_run_events(request, run_id):
     if request.method != 'GET':
         return HttpResponseNotAllowed(['GET'])
     try:
-        graph = Graph.objects.get(id=graph_id)
-        run_configs = graph.run_configs.all()
-        if not run_configs.exists():
-            return JsonResponse({"islands": []}, status=200)
-        run_config = run_configs.latest('id')
-        enabled_nodes = set(run_config.enable_list) if run_config.enable_list else set(graph.graph_nodes.values_list('node_id', flat=True))
-        if run_config.disable_list:
-            enabled_nodes -= set(run_config.disable_list)
-        adj = defaultdict(list)
-        for edge in Edge.objects.filter(src_node__graph=graph, src_node__node_id__in=enabled_nodes, dst_node__node_id__in=enabled_nodes):
-            adj[edge.src_node.node_id].append(edge.dst_node.node_id)
-        visited = set()
-        islands = []
-
-        for node in enabled_nodes:
-            if node not in visited:
-                island = []
-                queue = deque([node])
-                while queue:
-                    current = queue.popleft()
-                    if current not in visited:
-                        visited.add(current)
-                        island.append(current)
-                        for neighbor in adj[current]:
-                            if neighbor not in visited:
-                                queue.append(neighbor)
-                islands.append(island)
-        return JsonResponse({"islands": islands}, status=200)
+        start = int(request.headers.get('Last-Event-ID', -1)) + 1
+    except ValueError:
+        start = 0
+    channel = get_channel(run_id)
+    if channel is None:
+        # Not running in this process: replay a finished run from the database.
+        try:
+            run = await Run.objects.select_related('graph_run_config__graph').aget(run_id=run_id)
+        except Run.DoesNotExist:
+            # Imported here: checkpoints belongs to the deferred run path.
+            from .checkpoints import live_leases
+            if await live_leases().filter(run_id=run_id).aexists():
+                # Live events are only published in the worker process executing the run.
+                return HttpResponse(
+                    json.dumps({"error": "Run is executing in another worker process; retry once it has completed"}),
+                    content_type="application/json", status=409,
+                )
+            return HttpResponseBadRequest(json.dumps({"error": "Run not found"}), content_type="application/json")
+        plan, outputs = await asyncio.gather(
+            sync_to_async(get_plan)(run.graph_run_config.graph),
+            async_list(RunOutput.objects.filter(run=run).select_related('node__graph')),
+        )
+        outputs.sort(key=lambda output: (plan.levels[plan.index[output.node.node_id]], plan.index[output.node.node_id]))
+        channel = RunChannel(run_id)
+        current_level = None
+        for output in outputs:
+            level = plan.levels[plan.index[output.node.node_id]]
+            if level != current_level:
+                current_level = level
+                channel.publish('level', {"level": level})
+            channel.publish('node', {"node": output.node.node_id, "level": level, "data_out": output.get_data_out()})
+        channel.publish('summary', {"run_id": run_id, "status": "partial" if run.partial else "completed", "nodes": len(outputs)})
+        channel.close()
+
+    stream = channel.alisten(start) if isinstance(request, ASGIRequest) else channel.listen(start)
+    response = StreamingHttpResponse(stream, content_type="text/event-stream")
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+async def get_islands(request, graph_id):
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    try:
+        graph = await Graph.objects.aget(id=graph_id)
+        run_config = None
+        if 'config' in request.GET:
+            run_config = await graph.run_configs.aget(id=request.GET['config'])
+
+        async def render():
+            plan = await sync_to_async(get_plan)(graph)
+            if run_config is None:
+                return {"islands": plan.islands()}
+            return {"islands": plan.islands(run_config.enable_list, run_config.disable_list)}
+
+        return await cached_graph_response(request, graph, 'islands', render, run_config.id if run_config else 'all')
     except Graph.DoesNotExist:
         return HttpResponseBadRequest(json.dumps({"error": "Graph not found"}), content_type="application/json")
+    except (GraphRunConfig.DoesNotExist, ValueError):
+        return HttpResponseBadRequest(json.dumps({"error": "Run configuration not found for the graph"}), content_type="application/json")
+    except ValidationError as e:
+        return HttpResponseBadRequest(json.dumps({"error": str(e)}), content_type="application/json")
 
-def get_toposort(request, graph_id):
+async def get_toposort(request, graph_id):
     if request.method != 'GET':
         return HttpResponseNotAllowed(['GET'])
     try:
-        graph = Graph.objects.get(id=graph_id)
-        run_configs = graph.run_configs.all()
-        if not run_configs.exists():
-            return HttpResponseBadRequest(json.dumps({"error": "No run configurations found for the graph"}), content_type="application/json")
-        run_config = run_configs.latest('id')
-        executor = GraphExecutor(graph, run_config)
-        toposort = executor.topological_sort()
-        return JsonResponse({"toposort": toposort}, status=200)
+        graph = await Graph.objects.aget(id=graph_id)
+        async def render():
+            plan = await sync_to_async(get_plan)(graph)
+            return {"toposort": plan.node_ids}
+
+        return await cached_graph_response(request, graph, 'toposort', render)
     except Graph.DoesNotExist:
         return HttpResponseBadRequest(json.dumps({"error": "Graph not found"}), content_type="application/json")
     except ValidationError as e:
         return HttpResponseBadRequest(json.dumps({"error": str(e)}), content_type="application/json")
 
-def get_level_traversal(request, graph_id):
+async def get_level_traversal(request, graph_id):
     if request.method != 'GET':
         return HttpResponseNotAllowed(['GET'])
     try:
-        graph = Graph.objects.get(id=graph_id)
-        run_configs = graph.run_configs.all()
-        if not run_configs.exists():
-            return HttpResponseBadRequest(json.dumps({"error": "No run configurations found for the graph"}), content_type="application/json")
-        run_config = run_configs.latest('id')
-        executor = GraphExecutor(graph, run_config)
-        executor.topological_sort()
-        levels = defaultdict(list)
-        for node, level in executor.levels.items():
-            levels[level].append(node)
-        sorted_levels = dict(sorted(levels.items()))
-        return JsonResponse({"level_traversal": sorted_levels}, status=200)
+        graph = await Graph.objects.aget(id=graph_id)
+        async def render():
+            plan = await sync_to_async(get_plan)(graph)
+            return {"level_traversal": dict(sorted(plan.level_wise().items()))}
+
+        return await cached_graph_response(request, graph, 'level_traversal', render)
     except Graph.DoesNotExist:
         return HttpResponseBadRequest(json.dumps({"error": "Graph not found"}), content_type="application/json")
     except ValidationError as e:
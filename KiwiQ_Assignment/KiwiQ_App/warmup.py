@@ -0,0 +1,108 @@
+from .models import Graph, Run
+from .plans import get_plan
+from .storage import optional_module
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.db.models import Max
+from django.urls import get_resolver
+import importlib
+import logging
+import os
+import subprocess
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WARMUP = {
+    'ON_STARTUP': False,
+    'GRAPHS': 20,
+}
+# Imported by the views on first use rather than with the URLconf.
+DEFERRED_MODULES = ('KiwiQ_App.executor',)
+COLD_IMPORT_SCRIPT = (
+    "import django, importlib, sys, time; django.setup(); "
+    "started = time.perf_counter(); importlib.import_module(sys.argv[1]); "
+    "print((time.perf_counter() - started) * 1000)"
+)
+
+
+def warmup_options():
+    return {**DEFAULT_WARMUP, **getattr(settings, 'WARMUP', {})}
+
+def recently_run_graph_ids(limit):
+    return list(
+        Run.objects.values('graph_run_config__graph_id')
+        .annotate(last_run=Max('id'))
+        .order_by('-last_run')
+        .values_list('graph_run_config__graph_id', flat=True)[:limit]
+    )
+
+
+def cold_import_ms(module):
+    """Time importing ``module`` in a fresh interpreter once Django is set up."""
+    env = {**os.environ, 'DJANGO_SETTINGS_MODULE': os.environ.get('DJANGO_SETTINGS_MODULE', settings.SETTINGS_MODULE)}
+    result = subprocess.run(
+        [sys.executable, '-c', COLD_IMPORT_SCRIPT, module],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return float(result.stdout)
+
+
+def warm_up(limit):
+    """Pay in advance for what a process's first requests would: importing the
+    request path and compiling the plans of the ``limit`` most recently run graphs.
+
+    Plans are cached per process, so this only helps the process it runs in.
+    ``imports_ms`` only covers the ``modules`` this call actually imported.
+    """
+    loaded = len(sys.modules)
+    started = time.perf_counter()
+    get_resolver().url_patterns
+    for module in DEFERRED_MODULES:
+        importlib.import_module(module)
+    optional_module('msgpack')
+    optional_module('zstandard')
+    imports_ms = (time.perf_counter() - started) * 1000
+    modules = len(sys.modules) - loaded
+
+    started = time.perf_counter()
+    plans = 0
+    for graph in Graph.objects.filter(id__in=recently_run_graph_ids(limit)):
+        try:
+            get_plan(graph)
+        except ValidationError:
+            continue
+        plans += 1
+    return {
+        "imports_ms": imports_ms,
+        "modules": modules,
+        "plans": plans,
+        "plans_ms": (time.perf_counter() - started) * 1000,
+    }
+
+
+def warm_on_startup(setup_ms):
+    """Called by the WSGI/ASGI entry points once Django is set up."""
+    options = warmup_options()
+    report = {"setup_ms": setup_ms}
+    if options['ON_STARTUP']:
+        def run():
+            try:
+                report.update(warm_up(options['GRAPHS']))
+            except Exception:
+                logger.exception("Warmup failed")
+            finally:
+                connection.close()
+
+        # ASGI servers may load the application from inside a running event
+        # loop, where the ORM refuses synchronous queries.
+        thread = threading.Thread(target=run)
+        thread.start()
+        thread.join()
+    logger.info("Worker ready: %s", ", ".join(
+        f"{key}={value:.1f}" if isinstance(value, float) else f"{key}={value}" for key, value in report.items()
+    ))
+    return report
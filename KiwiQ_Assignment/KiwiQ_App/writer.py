@@ -0,0 +1,83 @@
+from django.conf import settings
+from django.db import connection, transaction
+from concurrent.futures import Future
+import queue
+import threading
+
+
+class RunWriter:
+    """Single background thread that applies every run write.
+
+    SQLite allows one writer at a time, so instead of letting each request
+    thread wait on the database lock, write jobs are queued here and applied
+    in batches, each job in its own savepoint inside one transaction.
+    """
+
+    def __init__(self, batch_size=64):
+        self.batch_size = batch_size
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, job, *args):
+        future = Future()
+        self.ensure_started()
+        self.queue.put((job, args, future))
+        return future
+
+    def write(self, job, *args):
+        return self.submit(job, *args).result()
+
+    def ensure_started(self):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self._loop, name='run-writer', daemon=True)
+                self.thread.start()
+
+    def _loop(self):
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            self._apply(batch)
+
+    def _apply(self, batch):
+        results = []
+        try:
+            with transaction.atomic():
+                for job, args, future in batch:
+                    try:
+                        with transaction.atomic():
+                            results.append((future, job(*args), None))
+                    except Exception as e:
+                        results.append((future, None, e))
+        except Exception as e:
+            results = [(future, None, e) for _, _, future in batch]
+            connection.close()
+
+        for future, result, error in results:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+def get_run_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            options = getattr(settings, 'RUN_WRITER', {})
+            _writer = RunWriter(batch_size=options.get('BATCH_SIZE', 64))
+        return _writer
+
+def write_run(job, *args):
+    if getattr(settings, 'RUN_WRITER', {}).get('ENABLED', False):
+        return get_run_writer().write(job, *args)
+    with transaction.atomic():
+        return job(*args)
@@ -74,13 +74,162 @@ WSGI_APPLICATION = 'KiwiQ_Assignment.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
+# WAL lets readers proceed while a run is being written; the pragmas below are
+# applied on every new connection and connections are kept open between requests.
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'CONN_MAX_AGE': 600,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            'timeout': 20,
+            'transaction_mode': 'IMMEDIATE',
+            'init_command': (
+                'PRAGMA journal_mode=WAL;'
+                'PRAGMA synchronous=NORMAL;'
+                'PRAGMA cache_size=-64000;'
+                'PRAGMA mmap_size=268435456;'
+                'PRAGMA temp_store=MEMORY;'
+                'PRAGMA busy_timeout=20000;'
+            ),
+        },
     }
 }
 
+# Run and RunOutput rows are written by a single background writer thread so
+# concurrent runs queue up instead of fighting over the SQLite write lock.
+
+RUN_WRITER = {
+    'ENABLED': True,
+    'BATCH_SIZE': 64,
+}
+
+# 'json' stores RunOutput.data_out as plain JSON. 'compact' stores it as a
+# compressed blob (msgpack/zstd when installed, JSON/zlib otherwise) whose keys
+# are indexes into a per-graph key dictionary. Both are decoded transparently.
+
+RUN_OUTPUT_STORAGE = {
+    'FORMAT': 'json',
+    'COMPRESSION_LEVEL': 6,
+}
+
+# Retention applied by `manage.py compact_runs`. KEEP_LAST is the number of runs
+# kept per graph and MAX_AGE_DAYS the age after which runs are removed (None
+# disables either rule). With ARCHIVE_DIR set, removed runs are first written
+# there as gzipped NDJSON which `manage.py restore_runs` can re-import.
+# Run configs without runs are dropped once unused for CONFIG_GRACE_HOURS.
+
+RUN_RETENTION = {
+    'KEEP_LAST': None,
+    'MAX_AGE_DAYS': None,
+    'ARCHIVE_DIR': None,
+    'CHUNK_SIZE': 500,
+    'CONFIG_GRACE_HOURS': 24,
+}
+
+
+# Cache
+# Rendered responses of the graph and run endpoints are kept here, see KiwiQ_App/caching.py
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'TIMEOUT': 600,
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    }
+}
+
+
+# Number of compiled graph plans (structure, gather plans, levels, islands)
+# each process keeps in memory, see KiwiQ_App/plans.py
+
+PLAN_CACHE_SIZE = 64
+
+# Number of most recent runs of a graph whose per-node timings the dry-run
+# planner averages into its cost estimates.
+
+PLANNER_TIMING_RUNS = 20
+
+# Graphs with at least MIN_NODES enabled nodes are split into shards executed
+# by WORKERS processes (defaults to the CPU count), see KiwiQ_App/sharding.py.
+
+SHARDED_EXECUTION = {
+    'ENABLED': False,
+    'MIN_NODES': 100000,
+    'WORKERS': None,
+}
+
+# Admission control for graph runs, see KiwiQ_App/admission.py. At most
+# MAX_RUNS runs execute at once, holding at most MAX_NODES enabled nodes
+# between them; up to MAX_QUEUED more wait up to QUEUE_TIMEOUT seconds for a
+# slot. Beyond that POST /graphs/<id>/run/ answers 429 with Retry-After.
+
+RUN_ADMISSION = {
+    'ENABLED': True,
+    'MAX_RUNS': 8,
+    'MAX_NODES': 200000,
+    'MAX_QUEUED': 64,
+    'QUEUE_TIMEOUT': 30,
+    'RETRY_AFTER': 1,
+}
+
+# Checkpointing of long runs, see KiwiQ_App/checkpoints.py. A running graph
+# saves its completed levels every EVERY_NODES outputs or EVERY_SECONDS, so an
+# interrupted run can be continued with POST /runs/<run_id>/resume/ or
+# manage.py resume_runs. Runs of more than SPILL_NODES nodes save their
+# outputs every EVERY_NODES outputs even when ENABLED is off, so they are not
+# all held in memory until the run is written (None holds them). Spilling
+# costs a second write of every output on the single writer: once as
+# checkpoint JSON, then copied into RunOutput rows in the run's write
+# transaction; manage.py bench_runs --spill-every N measures it. The executor
+# of a checkpointed run refreshes its lease every HEARTBEAT_SECONDS; the run
+# only counts as interrupted once no heartbeat came for STALE_SECONDS.
+
+RUN_CHECKPOINTS = {
+    'ENABLED': False,
+    'EVERY_NODES': 10000,
+    'EVERY_SECONDS': 60,
+    'SPILL_NODES': 50000,
+    'HEARTBEAT_SECONDS': 10,
+    'STALE_SECONDS': 60,
+}
+
+# Node output statistics (GET /graphs/<id>/nodes/<node_id>/stats/) are kept
+# in buckets of BUCKET_RUNS runs, each holding a percentile digest of at most
+# CENTROIDS centroids per output key, see KiwiQ_App/stats.py. They are updated
+# as runs are written; with UPDATE_ON_WRITE off, the first query after new
+# runs folds them in instead.
+
+NODE_STATS = {
+    'BUCKET_RUNS': 100,
+    'CENTROIDS': 100,
+    'UPDATE_ON_WRITE': True,
+}
+
+# Worker warmup, see KiwiQ_App/warmup.py. With ON_STARTUP the WSGI/ASGI entry
+# points import the run path the views defer and compile the plans of the
+# GRAPHS most recently run graphs before the worker serves requests. Setup and warmup times are logged by KiwiQ_App.warmup.
+
+WARMUP = {
+    'ON_STARTUP': False,
+    'GRAPHS': 20,
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'KiwiQ_App.warmup': {'handlers': ['console'], 'level': 'INFO'},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
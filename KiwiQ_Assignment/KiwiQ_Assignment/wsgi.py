@@ -8,9 +8,15 @@ https://docs.djangoproject.com/en/5.1/howto/deployment/wsgi/
 """
 
 import os
+import time
 
 from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'KiwiQ_Assignment.settings')
 
+started = time.perf_counter()
 application = get_wsgi_application()
+
+from KiwiQ_App.warmup import warm_on_startup
+
+warm_on_startup((time.perf_counter() - started) * 1000)